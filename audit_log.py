@@ -0,0 +1,108 @@
+import asyncio
+import time
+from datetime import timedelta
+
+import discord
+
+# =========================
+# Audit log actor attribution
+# =========================
+# Gateway delete events don't say who did it, the audit log does. Lookups
+# for the same (guild, action) are parked for a short moment and answered
+# by one audit_logs() page, so a burst of 50 deletions costs one request
+# instead of 50. The audit log often lags the gateway event by a few seconds
+# during a nuke, so targets that haven't shown up yet are fetched again with
+# a growing delay (0.75s, 1.5s, 3s, 6s by default); lookups arriving in the
+# meantime ride along with the next fetch. Only "not there yet" and Discord
+# 5xx errors are retried; without View Audit Log (Forbidden) the guild is
+# answered with None straight away for `forbidden_ttl` seconds, logged once.
+# Resolved entries are kept for `ttl` seconds so repeat lookups are free.
+
+AUDIT_PAGE = 100    # max entries per audit log request
+
+# _fetch outcomes
+FETCHED, RETRY, GIVE_UP = "fetched", "retry", "give_up"
+
+
+class AuditLogResolver:
+    def __init__(self, delay: float = 0.75, retries: int = 3, backoff: float = 2.0, ttl: float = 60.0,
+                 max_age: float = 60.0, forbidden_ttl: float = 300.0):
+        self.delay = delay          # how long lookups are collected before fetching
+        self.retries = retries      # extra fetches for targets not found yet
+        self.backoff = backoff      # each retry waits this many times longer
+        self.ttl = ttl
+        self.max_age = max_age      # older entries can't belong to a live event
+        self.forbidden_ttl = forbidden_ttl
+        self.fetches = 0
+        self._forbidden = {}        # guild_id -> monotonic time to try again
+        self._cache = {}            # (guild_id, action, target_id) -> (user, expires)
+        self._pending = {}          # (guild_id, action) -> {target_id: [futures]}
+        self._tasks = {}            # (guild_id, action) -> fetch task
+
+    async def actor(self, guild, action: discord.AuditLogAction, target_id: int):
+        """Who performed `action` on `target_id`, or None if it can't be resolved."""
+        hit = self._cache.get((guild.id, action, target_id))
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
+        if self._forbidden.get(guild.id, 0) > time.monotonic():
+            return None
+        key = (guild.id, action)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, {}).setdefault(target_id, []).append(future)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._resolve(guild, action))
+        return await future
+
+    async def _resolve(self, guild, action):
+        key = (guild.id, action)
+        try:
+            for attempt in range(self.retries + 1):
+                await asyncio.sleep(self.delay * self.backoff ** attempt)
+                outcome = await self._fetch(guild, action)
+                if outcome == GIVE_UP:
+                    break
+                waiting = self._pending.get(key, {})
+                for target_id in list(waiting):
+                    hit = self._cache.get((guild.id, action, target_id))
+                    if hit is not None:
+                        for future in waiting.pop(target_id):
+                            if not future.done():
+                                future.set_result(hit[0])
+                if not waiting:
+                    break
+        finally:
+            self._tasks.pop(key, None)
+            for futures in self._pending.pop(key, {}).values():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(None)
+
+    async def _fetch(self, guild, action):
+        self.fetches += 1
+        now = time.monotonic()
+        expires = now + self.ttl
+        cutoff = discord.utils.utcnow() - timedelta(seconds=self.max_age)
+        found = {}
+        try:
+            async for entry in guild.audit_logs(limit=AUDIT_PAGE, action=action):
+                if entry.created_at < cutoff:
+                    break
+                target_id = getattr(entry.target, "id", None)
+                # newest first, so the first entry for a target wins
+                if target_id is not None and target_id not in found:
+                    found[target_id] = entry.user
+        except discord.Forbidden:
+            if guild.id not in self._forbidden:
+                print(f"audit log unavailable in {guild.id}: missing View Audit Log, deletions won't be attributed")
+            self._forbidden[guild.id] = now + self.forbidden_ttl
+            return GIVE_UP
+        except discord.HTTPException as e:
+            print(f"audit log fetch failed in {guild.id}: {e}")
+            return RETRY if e.status >= 500 else GIVE_UP
+        self._forbidden.pop(guild.id, None)
+
+        for key in [k for k, (_, exp) in self._cache.items() if exp <= now]:
+            del self._cache[key]
+        for target_id, user in found.items():
+            self._cache[(guild.id, action, target_id)] = (user, expires)
+        return FETCHED
@@ -0,0 +1,403 @@
+import re
+import unicodedata
+from collections import OrderedDict, deque
+
+# =========================
+# Anti-spam rate limiter
+# =========================
+# One fixed-size deque of recent message times per (guild_id, user_id).
+# A user is spamming when their deque is full and the oldest entry is still
+# inside the window: O(1) per message. Keys live in an OrderedDict in
+# last-seen order, so sweeping idle authors only ever touches expired keys.
+
+
+class SpamTracker:
+    def __init__(self, limit: int = 5, window: float = 5.0, sweep_every: float = 5.0):
+        self.default = (limit, window)
+        self.guild_limits = {}          # guild_id -> (limit, window)
+        self.sweep_every = sweep_every
+        self._buckets = OrderedDict()   # (guild_id, user_id) -> deque of timestamps
+        self._last_sweep = 0.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def limits(self, guild_id):
+        return self.guild_limits.get(guild_id, self.default)
+
+    def configure(self, guild_id, limit: int, window: float):
+        self.guild_limits[guild_id] = (limit, window)
+
+    def hit(self, guild_id, user_id, now: float) -> bool:
+        """Record a message; True when it crosses the guild's spam threshold."""
+        limit, window = self.limits(guild_id)
+        key = (guild_id, user_id)
+        times = self._buckets.get(key)
+        if times is None or times.maxlen != limit:
+            times = self._buckets[key] = deque(maxlen=limit)
+        # reassigning an existing key keeps its old spot, so always move it
+        self._buckets.move_to_end(key)
+        times.append(now)
+
+        if now - self._last_sweep >= self.sweep_every:
+            self.sweep(now)
+
+        if len(times) == limit and now - times[0] < window:
+            times.clear()
+            return True
+        return False
+
+    def sweep(self, now: float):
+        """Forget authors idle for longer than the longest window: none of
+        their timestamps can count towards a hit any more."""
+        self._last_sweep = now
+        cutoff = now - max([self.default[1]] + [w for _, w in self.guild_limits.values()])
+        buckets = self._buckets
+        while buckets:
+            key, times = next(iter(buckets.items()))
+            if times and times[-1] >= cutoff:
+                break
+            buckets.popitem(last=False)
+
+
+# =========================
+# Content filter
+# =========================
+# Invite domains and banned words for a guild are merged into one trie and
+# emitted as a single regex whose alternatives all start with a literal
+# character, which lets `re` skip ahead with its first-character fast scan
+# instead of trying every rule at every position. Custom regexes are joined
+# into a second combined pattern; the text is lowercased by normalize(), so
+# only rules written with capitals get a case-insensitive group of their
+# own. Text is normalized first so look-alike and zero-width tricks can't
+# split a match.
+
+DEFAULT_INVITE_DOMAINS = (
+    "discord.gg", "discord.com/invite", "discordapp.com/invite", "discord.me",
+    "discord.io", "discord.li", "dsc.gg", "invite.gg",
+)
+
+ZERO_WIDTH = dict.fromkeys([0x00AD, 0x180E, *range(0x200B, 0x2010), *range(0x2060, 0x2065), 0xFEFF])
+
+# "discord.gg", "discord . gg", "discord(dot)gg", "discord。gg"
+_DOT = r"\s*(?:[.\u3002\uff61]|\(dot\)|\[dot\]|\(\.\)|\[\.\])\s*"
+_SLASH = r"\s*/\s*"
+
+MAX_REGEX_LENGTH = 200
+
+
+def normalize(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    return unicodedata.normalize("NFKC", text).translate(ZERO_WIDTH).casefold()
+
+
+def _domain_units(domain: str):
+    """'discord.com/invite' -> ['d', ..., _DOT, 'c', ..., _SLASH, 'i', ..., _SLASH]"""
+    units = []
+    for path_part in domain.split("/"):
+        for host_part in path_part.split("."):
+            units.extend(re.escape(ch) for ch in host_part)
+            units.append(_DOT)
+        units[-1] = _SLASH
+    return units
+
+
+class _TrieNode:
+    __slots__ = ("children", "end")
+
+    def __init__(self):
+        self.children = {}      # regex unit -> _TrieNode
+        self.end = None         # "invite" | "word" | None
+
+    def insert(self, units, kind):
+        node = self
+        for unit in units:
+            node = node.children.setdefault(unit, _TrieNode())
+        # an invite rule beats a banned word with the same spelling
+        if node.end != "invite":
+            node.end = kind
+
+    def pattern(self) -> str:
+        alts = [unit + child.pattern() for unit, child in sorted(self.children.items())]
+        # ending here is the last resort, so longer rules win
+        if self.end == "word":
+            alts.append(r"(?!\w)")
+        elif self.end == "invite":
+            alts.append("")
+        if len(alts) == 1:
+            return alts[0]
+        return "(?:" + "|".join(alts) + ")"
+
+
+_GLOBAL_FLAGS = re.compile(r"\(\?([aimsux]+)\)")
+_ESCAPE = re.compile(r"\\.")
+
+
+def _scoped(pattern: str) -> str:
+    """'(?i)spam' -> '(?i:spam)': leading global flags only work at the very
+    start of an expression, so they're scoped to the rule before joining.
+    'FREE NITRO' -> '(?i:FREE NITRO)': the text is already lowercase, so
+    capitals (outside escapes like \\S) could never match otherwise. A global
+    re.IGNORECASE would cost every rule re's fast literal scan."""
+    flags = ""
+    m = _GLOBAL_FLAGS.match(pattern)
+    if m is not None:
+        flags, pattern = m.group(1), pattern[m.end():]
+    bare = _ESCAPE.sub("", pattern)
+    if "i" not in flags and bare != bare.lower():
+        flags += "i"
+    return f"(?{flags}:{pattern})" if flags else f"(?:{pattern})"
+
+
+def combine_regexes(patterns):
+    """One pattern matching any of `patterns`. Raises re.error when they can't
+    share one expression (e.g. two rules defining the same named group)."""
+    return re.compile("|".join(map(_scoped, patterns)))
+
+
+# User regexes run synchronously on every message, so a pattern that can
+# backtrack catastrophically ((a+)+$ against "aaaa...b") would stall the whole
+# loop. Patterns are vetted on their parse tree instead; rejected are
+#   - a quantifier inside a quantifier: (a+)+, (\w+\s?)*, (a{1,9}){1,9}
+#   - alternatives under a quantifier that can start with the same
+#     character: (a|aa)+, (\w|\d)*
+#   - two quantifiers in a row that can eat the same characters, with
+#     nothing in between to tell them apart: \s*\s*, .*.*, \w+a\w+
+#   - a capturing group under a quantifier, (\w)*: re saves the group on
+#     every iteration, ~6x slower than (?:\w)*
+# which are the shapes behind exponential and high-polynomial backtracking.
+# What's left is at worst quadratic in the message length (~50ms for a
+# 4000 character message).
+_OPS = re._parser if hasattr(re, "_parser") else __import__("sre_parse")
+_REPEATS = (_OPS.MAX_REPEAT, _OPS.MIN_REPEAT)
+_SAMPLE = [chr(c) for c in (*range(0x09, 0x0E), *range(0x20, 0x250), 0x3000, 0xFF21)]
+_CATEGORIES = {
+    _OPS.CATEGORY_DIGIT: str.isdigit, _OPS.CATEGORY_NOT_DIGIT: lambda c: not c.isdigit(),
+    _OPS.CATEGORY_SPACE: str.isspace, _OPS.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+    _OPS.CATEGORY_WORD: lambda c: c.isalnum() or c == "_",
+    _OPS.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == "_"),
+}
+
+
+def _charset(items) -> frozenset:
+    """Every sample character some atom in `items` could consume (an over-estimate)."""
+    chars = set()
+    for op, av in items:
+        if op is _OPS.LITERAL:
+            chars.add(chr(av))
+        elif op in (_OPS.NOT_LITERAL, _OPS.ANY, _OPS.GROUPREF):
+            return frozenset(_SAMPLE)
+        elif op is _OPS.IN:
+            negate = any(o is _OPS.NEGATE for o, _ in av)
+            tests = []
+            for o, a in av:
+                if o is _OPS.LITERAL:
+                    tests.append(lambda c, a=a: ord(c) == a)
+                elif o is _OPS.RANGE:
+                    tests.append(lambda c, a=a: a[0] <= ord(c) <= a[1])
+                elif o is _OPS.CATEGORY:
+                    tests.append(_CATEGORIES.get(a, lambda c: True))
+            chars.update(c for c in _SAMPLE if any(t(c) for t in tests) != negate)
+        elif op in _REPEATS:
+            chars |= _charset(av[2])
+        elif op is _OPS.SUBPATTERN:
+            chars |= _charset(av[-1])
+        elif op is _OPS.BRANCH:
+            for alt in av[1]:
+                chars |= _charset(alt)
+    return frozenset(chars)
+
+
+def _first_chars(items) -> frozenset:
+    """Sample characters a match of `items` could start with."""
+    for op, av in items:
+        if op is _OPS.AT:
+            continue
+        if op in _REPEATS:
+            first = _charset(av[2])
+            return first if av[0] > 0 else first | _first_chars(items[1:])
+        return _charset([(op, av)])
+    return frozenset()
+
+
+def _has_repeat(items) -> bool:
+    for op, av in items:
+        if op in _REPEATS and av[1] > 1:
+            return True
+        if op is _OPS.SUBPATTERN and _has_repeat(av[-1]):
+            return True
+        if op is _OPS.BRANCH and any(_has_repeat(alt) for alt in av[1]):
+            return True
+    return False
+
+
+def _vet(items, prev=frozenset()):
+    """Walk a parsed pattern, raising ValueError on risky shapes. `prev` is what
+    the last unbounded-ish quantifier could still be eating."""
+    for op, av in items:
+        if op in _REPEATS:
+            lo, hi, body = av
+            if hi > 1:
+                if _has_repeat(body):
+                    raise ValueError("nested quantifiers like (a+)+ can freeze the bot")
+                if any(bop is _OPS.SUBPATTERN and bav[0] is not None for bop, bav in body):
+                    raise ValueError("repeated groups must be non-capturing: use (?:...) instead of (...)")
+                for bop, bav in body:
+                    inner = bav[-1] if bop is _OPS.SUBPATTERN else [(bop, bav)]
+                    for iop, iav in inner:
+                        if iop is _OPS.BRANCH:
+                            firsts = [_first_chars(alt) for alt in iav[1]]
+                            seen = set()
+                            for first in firsts:
+                                if seen & first or not first:
+                                    raise ValueError("alternatives under a quantifier must start differently, "
+                                                     "e.g. (a|aa)+ can freeze the bot")
+                                seen |= first
+                chars = _charset(body)
+                if prev & chars:
+                    raise ValueError("back-to-back quantifiers matching the same characters "
+                                     "(like \\s*\\s* or .*.*) can freeze the bot")
+                prev = chars
+            else:
+                prev = _vet(body, prev)
+        elif op is _OPS.SUBPATTERN:
+            prev = _vet(av[-1], prev)
+        elif op is _OPS.BRANCH:
+            prev = frozenset().union(*(_vet(alt, prev) for alt in av[1]))
+        elif op in (_OPS.ASSERT, _OPS.ASSERT_NOT):
+            _vet(av[1])
+        elif op is _OPS.AT:
+            continue
+        else:
+            # a character the previous quantifier can't eat ends its run
+            chars = _charset([(op, av)])
+            if not (prev & chars):
+                prev = frozenset()
+    return prev
+
+
+def validate_regex(pattern: str, others=()):
+    """Raise ValueError for patterns that can't be safely folded into the filter
+    next to the guild's `others`."""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise ValueError(f"pattern longer than {MAX_REGEX_LENGTH} characters")
+    try:
+        re.compile(pattern)
+        parsed = _OPS.parse(pattern)
+    except re.error as e:
+        raise ValueError(str(e)) from None
+    _vet(list(parsed))
+    try:
+        combine_regexes([*others, pattern])
+    except re.error as e:
+        raise ValueError(f"can't be combined with this server's other filters: {e}") from None
+
+
+class GuildFilterRules:
+    def __init__(self):
+        self.invites = True
+        self.words = set()
+        self.regexes = []
+
+
+class ContentFilter:
+    def __init__(self, invite_domains=DEFAULT_INVITE_DOMAINS):
+        self.invite_domains = tuple(invite_domains)
+        invite_trie = _TrieNode()
+        for domain in self.invite_domains:
+            invite_trie.insert(_domain_units(domain), "invite")
+        self._invite_re = re.compile(invite_trie.pattern())
+        self.rules = {}         # guild_id -> GuildFilterRules
+        self._compiled = {}     # guild_id -> (literal pattern | None, [regex patterns], invites)
+
+    def guild_rules(self, guild_id) -> GuildFilterRules:
+        rules = self.rules.get(guild_id)
+        if rules is None:
+            rules = self.rules[guild_id] = GuildFilterRules()
+        return rules
+
+    def invalidate(self, guild_id):
+        self._compiled.pop(guild_id, None)
+
+    def add_word(self, guild_id, word: str):
+        word = normalize(word).strip()
+        if word:
+            self.guild_rules(guild_id).words.add(word)
+            self.invalidate(guild_id)
+
+    def remove_word(self, guild_id, word: str):
+        self.guild_rules(guild_id).words.discard(normalize(word).strip())
+        self.invalidate(guild_id)
+
+    def add_regex(self, guild_id, pattern: str):
+        rules = self.guild_rules(guild_id)
+        if pattern in rules.regexes:
+            return
+        validate_regex(pattern, rules.regexes)
+        rules.regexes.append(pattern)
+        self.invalidate(guild_id)
+
+    def remove_regex(self, guild_id, pattern: str):
+        rules = self.guild_rules(guild_id)
+        if pattern in rules.regexes:
+            rules.regexes.remove(pattern)
+        self.invalidate(guild_id)
+
+    def _compile(self, guild_id):
+        rules = self.rules.get(guild_id) or GuildFilterRules()
+        trie = _TrieNode()
+        if rules.invites:
+            for domain in self.invite_domains:
+                trie.insert(_domain_units(domain), "invite")
+        for word in rules.words:
+            trie.insert([re.escape(ch) for ch in word], "word")
+        literal = re.compile(trie.pattern()) if trie.children else None
+        regexes = []
+        if rules.regexes:
+            try:
+                regexes = [combine_regexes(rules.regexes)]
+            except re.error as e:
+                # add_regex keeps this from happening; if it does anyway, one
+                # pattern per rule is slower but never takes the guild down
+                print(f"content filter for guild {guild_id} can't be combined ({e}), matching rules one by one")
+                for r in rules.regexes:
+                    try:
+                        regexes.append(re.compile(_scoped(r)))
+                    except re.error:
+                        pass
+        return literal, regexes, rules.invites
+
+    def check(self, guild_id, text: str):
+        """(kind, matched text) for the first rule hit, kind being
+        'invite', 'word' or 'regex'; None when the text is clean."""
+        if not text:
+            return None
+        try:
+            literal, regexes, invites = self._compiled[guild_id]
+        except KeyError:
+            literal, regexes, invites = self._compiled[guild_id] = self._compile(guild_id)
+        if literal is None and not regexes:
+            return None
+        text = normalize(text)
+
+        if literal is not None:
+            pos = 0
+            while True:
+                m = literal.search(text, pos)
+                if m is None:
+                    break
+                start = m.start()
+                invite = self._invite_re.match(text, start) if invites else None
+                if invite is not None:
+                    return "invite", invite.group()
+                # banned words must also start on a word boundary
+                if start == 0 or not (text[start - 1].isalnum() or text[start - 1] == "_"):
+                    return "word", m.group()
+                pos = start + 1
+
+        for regex in regexes:
+            m = regex.search(text)
+            if m is not None:
+                return "regex", m.group()
+        return None
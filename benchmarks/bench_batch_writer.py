@@ -0,0 +1,68 @@
+"""Commit-per-case vs BatchWriter during a burst of concurrent case inserts.
+
+Usage: python benchmarks/bench_batch_writer.py [rows]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import BatchWriter, Database  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cases (
+        case_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        moderator_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        reason TEXT,
+        timestamp TEXT
+    )
+"""
+INSERT = "INSERT INTO cases (guild_id, user_id, moderator_id, action, reason, timestamp) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def row(i):
+    return (1, i % 500, 42, "Warn", "bench", "2024-01-01T00:00:00+00:00")
+
+
+async def commit_each(db, path, rows):
+    async def one(i):
+        async with db.acquire(path) as conn:
+            cur = await conn.execute(INSERT, row(i))
+            await conn.commit()
+            return cur.lastrowid
+    return await asyncio.gather(*(one(i) for i in range(rows)))
+
+
+async def batched(db, path, rows):
+    writer = BatchWriter(db, path)
+    writer.start()
+    ids = await asyncio.gather(*(writer.submit(INSERT, row(i)) for i in range(rows)))
+    await writer.stop()
+    print(f"    {writer.stats.summary()}")
+    return ids
+
+
+async def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in (("commit per case", commit_each), ("batch writer", batched)):
+            path = os.path.join(tmp, f"{name.split()[0]}.db")
+            db = Database()
+            await db.open(path)
+            async with db.acquire(path) as conn:
+                await conn.execute(SCHEMA)
+                await conn.commit()
+            start = time.perf_counter()
+            ids = await fn(db, path, rows)
+            elapsed = time.perf_counter() - start
+            await db.close()
+            assert len(set(ids)) == rows, "every caller should get its own case_id"
+            print(f"{name:<16} {rows} inserts in {elapsed:6.2f}s  ({rows / elapsed:8.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
@@ -0,0 +1,68 @@
+"""Per-call aiosqlite.connect vs pooled connections for case inserts.
+
+Usage: python benchmarks/bench_db_pool.py [rows]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import Database  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cases (
+        case_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        moderator_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        reason TEXT,
+        timestamp TEXT
+    )
+"""
+INSERT = "INSERT INTO cases (guild_id, user_id, moderator_id, action, reason, timestamp) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def row(i):
+    return (1, i % 500, 42, "Warn", "bench", "2024-01-01T00:00:00+00:00")
+
+
+async def per_call(path, rows):
+    # what add_case used to do: new connection + commit for every case
+    for i in range(rows):
+        async with aiosqlite.connect(path) as db:
+            await db.execute(INSERT, row(i))
+            await db.commit()
+
+
+async def pooled(path, rows):
+    pool = Database()
+    await pool.open(path)
+    try:
+        for i in range(rows):
+            async with pool.acquire(path) as db:
+                await db.execute(INSERT, row(i))
+                await db.commit()
+    finally:
+        await pool.close()
+
+
+async def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in (("per-call connect", per_call), ("pooled (WAL)", pooled)):
+            path = os.path.join(tmp, f"{name.split()[0]}.db")
+            async with aiosqlite.connect(path) as db:
+                await db.execute(SCHEMA)
+                await db.commit()
+            start = time.perf_counter()
+            await fn(path, rows)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<18} {rows} inserts in {elapsed:7.2f}s  ({rows / elapsed:8.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
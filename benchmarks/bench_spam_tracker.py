@@ -0,0 +1,59 @@
+"""Memory and throughput of SpamTracker vs the old defaultdict(list) tracker
+when millions of distinct authors each post once.
+
+Usage: python benchmarks/bench_spam_tracker.py [authors]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from automod import SpamTracker  # noqa: E402
+
+RATE = 5_000          # simulated messages per second
+CHECKPOINTS = 5
+
+
+def old_tracker(authors):
+    spam_tracker = defaultdict(list)
+    for i in range(authors):
+        now = i / RATE
+        last_times = spam_tracker[i]
+        spam_tracker[i] = [t for t in last_times if now - t < 5]
+        spam_tracker[i].append(now)
+        if len(spam_tracker[i]) >= 5:
+            spam_tracker[i] = []
+        yield i, len(spam_tracker)
+
+
+def new_tracker(authors):
+    tracker = SpamTracker()
+    for i in range(authors):
+        tracker.hit(1, i, i / RATE)
+        yield i, len(tracker)
+
+
+def run(name, gen, authors):
+    start = time.perf_counter()
+    for _ in gen(authors):
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"{name}: {authors / elapsed:,.0f} msgs/s")
+
+    step = authors // CHECKPOINTS
+    tracemalloc.start()
+    rows = []
+    for i, keys in gen(authors):
+        if (i + 1) % step == 0:
+            rows.append((i + 1, keys, tracemalloc.get_traced_memory()[0]))
+    tracemalloc.stop()
+    for n, keys, mem in rows:
+        print(f"    after {n:>10,} authors: {keys:>10,} keys  {mem / 1024 / 1024:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    authors = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    run("old defaultdict(list)", old_tracker, authors)
+    run("SpamTracker", new_tracker, authors)
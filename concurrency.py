@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import discord
+
+# =========================
+# Bounded, rate-limit-aware fan-out
+# =========================
+# Runs one coroutine per item with at most `concurrency` in flight (size it
+# to the Discord route bucket being hit). 429s that discord.py surfaces
+# instead of sleeping through are retried after their retry-after. Each
+# named phase records its own timing so callers can report throughput.
+
+
+def retry_after(exc):
+    """Seconds to wait before retrying exc, or None if it isn't a rate limit."""
+    if isinstance(exc, discord.RateLimited):
+        return exc.retry_after
+    if isinstance(exc, discord.HTTPException) and exc.status == 429:
+        try:
+            return float(exc.response.headers.get("Retry-After", 1))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    return None
+
+
+class PhaseStats:
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.first_error = None
+
+    def rate(self) -> float:
+        return self.done / self.elapsed if self.elapsed else 0.0
+
+    def line(self) -> str:
+        text = f"{self.name}: {self.done - self.failed}/{self.total} ok in {self.elapsed:.1f}s ({self.rate():.1f}/s)"
+        if self.retries:
+            text += f", {self.retries} rate-limit retries"
+        if self.failed:
+            text += f", {self.failed} failed ({self.first_error})"
+        return text
+
+
+class FanOut:
+    def __init__(self, on_progress=None, progress_every: float = 2.0, max_retries: int = 3):
+        self.on_progress = on_progress      # async fn(PhaseStats)
+        self.progress_every = progress_every
+        self.max_retries = max_retries
+        self.phases = []
+
+    async def run(self, name: str, fn, items, concurrency: int):
+        """Await fn(item) for every item; results (or exceptions) come back in order."""
+        items = list(items)
+        stats = PhaseStats(name, len(items))
+        self.phases.append(stats)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(item):
+            async with semaphore:
+                try:
+                    for attempt in range(self.max_retries + 1):
+                        try:
+                            return await fn(item)
+                        except Exception as e:
+                            delay = retry_after(e)
+                            if delay is None or attempt == self.max_retries:
+                                raise
+                            stats.retries += 1
+                            await asyncio.sleep(delay)
+                except Exception as e:
+                    stats.failed += 1
+                    if stats.first_error is None:
+                        stats.first_error = e
+                    raise
+                finally:
+                    stats.done += 1
+
+        reporter = asyncio.create_task(self._report(stats)) if self.on_progress else None
+        try:
+            results = await asyncio.gather(*(one(i) for i in items), return_exceptions=True)
+        finally:
+            stats.elapsed = time.perf_counter() - stats.started
+            if reporter:
+                reporter.cancel()
+        if self.on_progress:
+            try:
+                await self.on_progress(stats)
+            except Exception:
+                pass
+        return results
+
+    async def _report(self, stats):
+        while True:
+            await asyncio.sleep(self.progress_every)
+            stats.elapsed = time.perf_counter() - stats.started
+            try:
+                await self.on_progress(stats)
+            except Exception:
+                pass
+
+    def summary(self) -> str:
+        return "\n".join(p.line() for p in self.phases)
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from concurrency import FanOut
+
+# =========================
+# Emoji image cache
+# =========================
+# Emoji images are kept on disk named by the sha256 of their bytes
+# (emoji_cache/ab/abcd....png), with a small JSON index mapping emoji id ->
+# digest. Restores read from here instead of the CDN, which may already have
+# dropped a deleted emoji. Index entries of deleted emojis are kept for
+# `retention` seconds; blobs nothing points at any more are removed.
+
+
+class EmojiCache:
+    def __init__(self, root: str = "emoji_cache", retention: float = 30 * 86400, concurrency: int = 4):
+        self.root = root
+        self.retention = retention
+        self.concurrency = concurrency      # parallel CDN downloads while refreshing
+        self.index = {}                     # str(emoji_id) -> {digest, animated, guild_id, name, deleted_at}
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = asyncio.Lock()
+
+    def _blob_path(self, digest, animated):
+        return os.path.join(self.root, digest[:2], f"{digest}.{'gif' if animated else 'png'}")
+
+    async def load(self):
+        def read():
+            try:
+                with open(self._index_path) as f:
+                    return json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return {}
+        self.index = await asyncio.to_thread(read)
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, separators=(",", ":"))
+        os.replace(tmp, self._index_path)
+
+    @staticmethod
+    def _write_blob(path, data):
+        if os.path.exists(path):
+            return      # same digest, same bytes
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    async def _store(self, emoji):
+        data = await emoji.read()
+        digest = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write_blob, self._blob_path(digest, emoji.animated), data)
+        self.index[str(emoji.id)] = {"digest": digest, "animated": emoji.animated, "guild_id": emoji.guild_id,
+                                     "name": emoji.name, "deleted_at": None}
+
+    async def refresh(self, guild):
+        """Download emojis not cached yet, mark removed ones deleted. Returns
+        (downloaded, failed)."""
+        async with self._lock:
+            live = {str(e.id): e for e in guild.emojis}
+            missing = [e for key, e in live.items() if key not in self.index]
+            failed = 0
+            if missing:
+                results = await FanOut().run("emoji-cache", self._store, missing, self.concurrency)
+                failed = sum(isinstance(r, Exception) for r in results)
+
+            now = time.time()
+            for key, entry in self.index.items():
+                if entry["guild_id"] != guild.id:
+                    continue
+                if key in live:
+                    entry["name"] = live[key].name
+                    entry["deleted_at"] = None
+                elif entry["deleted_at"] is None:
+                    entry["deleted_at"] = now
+            await asyncio.to_thread(self._prune_and_save, now)
+            return len(missing) - failed, failed
+
+    def _prune_and_save(self, now):
+        for key in [k for k, e in self.index.items() if e["deleted_at"] and now - e["deleted_at"] > self.retention]:
+            del self.index[key]
+        wanted = {self._blob_path(e["digest"], e["animated"]) for e in self.index.values()}
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if dirpath != self.root and path not in wanted:
+                        os.remove(path)
+        self._save_index()
+
+    async def read(self, emoji_id):
+        """Cached image bytes for an emoji id, or None."""
+        entry = self.index.get(str(emoji_id))
+        if entry is None:
+            return None
+
+        def read():
+            try:
+                with open(self._blob_path(entry["digest"], entry["animated"]), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        return await asyncio.to_thread(read)
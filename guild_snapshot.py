@@ -0,0 +1,315 @@
+import hashlib
+import json
+import zlib
+from collections import defaultdict
+
+import discord
+
+from concurrency import FanOut
+
+# =========================
+# Guild structure snapshots
+# =========================
+# Roles, channels (categories included), overwrites, positions and emoji
+# metadata are serialized per object. Storage is versioned: saving only
+# writes objects whose digest changed since the last snapshot and closes
+# the rows of objects that changed or disappeared, so an idle guild costs
+# one read per snapshot and nothing on disk.
+
+ROLE, CHANNEL, EMOJI = "role", "channel", "emoji"
+
+ROLE_CONCURRENCY = 3        # role create/edit share one per-guild bucket
+CHANNEL_CONCURRENCY = 5
+EMOJI_CONCURRENCY = 2       # emoji uploads have the tightest limits
+
+
+def _overwrites(channel):
+    out = []
+    for target, overwrite in channel.overwrites.items():
+        allow, deny = overwrite.pair()
+        out.append([target.id, 0 if isinstance(target, discord.Role) else 1, allow.value, deny.value])
+    return sorted(out)
+
+
+def serialize_role(role):
+    return {"name": role.name, "permissions": role.permissions.value, "color": role.color.value,
+            "hoist": role.hoist, "mentionable": role.mentionable, "position": role.position}
+
+
+def serialize_channel(channel):
+    record = {"name": channel.name, "type": channel.type.value, "position": channel.position,
+              "category_id": getattr(channel, "category_id", None), "overwrites": _overwrites(channel)}
+    for attr in ("topic", "nsfw", "slowmode_delay", "bitrate", "user_limit"):
+        value = getattr(channel, attr, None)
+        if value is not None:
+            record[attr] = value
+    return record
+
+
+def serialize_emoji(emoji):
+    return {"name": emoji.name, "animated": emoji.animated, "roles": sorted(r.id for r in emoji.roles)}
+
+
+def capture(guild):
+    """{(kind, object_id): record} for everything a restore can rebuild."""
+    objects = {}
+    for role in guild.roles:
+        if not role.managed:
+            objects[(ROLE, role.id)] = serialize_role(role)
+    for channel in guild.channels:
+        objects[(CHANNEL, channel.id)] = serialize_channel(channel)
+    for emoji in guild.emojis:
+        objects[(EMOJI, emoji.id)] = serialize_emoji(emoji)
+    return objects
+
+
+def _encode(record):
+    raw = json.dumps(record, separators=(",", ":"), sort_keys=True).encode()
+    return hashlib.blake2b(raw, digest_size=16).digest(), zlib.compress(raw)
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(data))
+
+
+# -------------------------
+# Storage (bot.db: guild_snapshots / guild_objects)
+# -------------------------
+async def save_snapshot(db, guild_id, objects, taken_at, keep=48):
+    """Diff objects against the open rows. Returns (snapshot_id, changed);
+    snapshot_id is None when nothing changed since the last snapshot."""
+    async with db.execute(
+        "SELECT kind, object_id, digest, id FROM guild_objects WHERE guild_id = ? AND valid_to IS NULL", (guild_id,)
+    ) as cur:
+        current = {(kind, oid): (digest, row_id) for kind, oid, digest, row_id in await cur.fetchall()}
+
+    inserts, closes = [], []
+    for key, record in objects.items():
+        digest, data = _encode(record)
+        old = current.pop(key, None)
+        if old is not None and old[0] == digest:
+            continue
+        if old is not None:
+            closes.append(old[1])
+        inserts.append((key, digest, data))
+    closes.extend(row_id for _, row_id in current.values())   # objects that are gone
+    if not inserts and not closes:
+        return None, 0
+
+    cur = await db.execute("INSERT INTO guild_snapshots (guild_id, taken_at, changed) VALUES (?, ?, ?)",
+                           (guild_id, taken_at, len(inserts) + len(closes)))
+    snapshot_id = cur.lastrowid
+    await db.executemany("UPDATE guild_objects SET valid_to = ? WHERE id = ?", [(snapshot_id, r) for r in closes])
+    await db.executemany(
+        "INSERT INTO guild_objects (guild_id, kind, object_id, valid_from, digest, data) VALUES (?, ?, ?, ?, ?, ?)",
+        [(guild_id, kind, oid, snapshot_id, digest, data) for (kind, oid), digest, data in inserts]
+    )
+
+    # keep the newest `keep` snapshots; rows closed before the oldest one are unreachable
+    async with db.execute("SELECT id FROM guild_snapshots WHERE guild_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                          (guild_id, keep - 1)) as cur:
+        row = await cur.fetchone()
+    if row is not None:
+        await db.execute("DELETE FROM guild_snapshots WHERE guild_id = ? AND id < ?", (guild_id, row[0]))
+        await db.execute("DELETE FROM guild_objects WHERE guild_id = ? AND valid_to <= ?", (guild_id, row[0]))
+    await db.commit()
+    return snapshot_id, len(inserts) + len(closes)
+
+
+async def list_snapshots(db, guild_id, limit=10):
+    async with db.execute("SELECT id, taken_at, changed FROM guild_snapshots WHERE guild_id = ? ORDER BY id DESC LIMIT ?",
+                          (guild_id, limit)) as cur:
+        return await cur.fetchall()
+
+
+async def load_snapshot(db, guild_id, snapshot_id):
+    """The guild as it was at snapshot_id, in capture() format."""
+    async with db.execute(
+        "SELECT kind, object_id, data FROM guild_objects WHERE guild_id = ? AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)",
+        (guild_id, snapshot_id, snapshot_id)
+    ) as cur:
+        return {(kind, oid): _decode(data) for kind, oid, data in await cur.fetchall()}
+
+
+# -------------------------
+# Restore
+# -------------------------
+async def create_channel(guild, record, *, category=None, overwrites=None, reason=None):
+    """Recreate a channel from its record with the right channel type."""
+    kind = discord.ChannelType(record["type"])
+    kwargs = {"position": record["position"], "overwrites": overwrites or {}, "reason": reason}
+    if kind is discord.ChannelType.category:
+        return await guild.create_category(record["name"], **kwargs)
+    kwargs["category"] = category
+    if kind in (discord.ChannelType.voice, discord.ChannelType.stage_voice):
+        create = guild.create_voice_channel if kind is discord.ChannelType.voice else guild.create_stage_channel
+        # the bitrate cap drops with the boost level
+        bitrate = min(record.get("bitrate", 64000), int(guild.bitrate_limit))
+        return await create(record["name"], bitrate=bitrate, user_limit=record.get("user_limit", 0), **kwargs)
+    if kind in (discord.ChannelType.forum, discord.ChannelType.media):
+        return await guild.create_forum(record["name"], topic=record.get("topic") or "", nsfw=record.get("nsfw", False),
+                                        media=kind is discord.ChannelType.media, **kwargs)
+    return await guild.create_text_channel(record["name"], news=kind is discord.ChannelType.news,
+                                           topic=record.get("topic") or "", nsfw=record.get("nsfw", False),
+                                           slowmode_delay=record.get("slowmode_delay", 0), **kwargs)
+
+
+def _match(records, live, key):
+    """Map snapshot ids to live ids: same id first, then same key (name/type)
+    for objects recreated since, e.g. by the per-event anti-nuke restore.
+    Returns (mapping, [(snapshot_id, record)] still missing)."""
+    mapping = {oid: oid for oid in records if oid in live}
+    by_key = defaultdict(list)
+    for lid, record in live.items():
+        if lid not in records:
+            by_key[key(record)].append(lid)
+    missing = []
+    for oid, record in sorted(records.items(), key=lambda kv: kv[1].get("position", 0)):
+        if oid in mapping:
+            continue
+        candidates = by_key.get(key(record))
+        if candidates:
+            mapping[oid] = candidates.pop(0)
+        else:
+            missing.append((oid, record))
+    return mapping, missing
+
+
+class GuildRestore:
+    """Rebuild what a snapshot has and the guild doesn't: roles, categories,
+    channels and emojis, each phase fanned out under its own limit, then one
+    reorder pass for role and channel positions."""
+
+    def __init__(self, guild, state, *, http, fetch_emoji, reason, on_progress=None):
+        self.guild = guild
+        self.state = state
+        self.http = http
+        self.fetch_emoji = fetch_emoji      # async fn(emoji_id, record) -> bytes
+        self.reason = reason
+        self.fanout = FanOut(on_progress=on_progress)
+        self.role_ids = {}                  # snapshot role id -> live role id
+        self.channel_ids = {}               # snapshot channel id -> live channel id
+        self.categories = {}                # snapshot category id -> CategoryChannel created here
+
+    def _records(self, kind):
+        return {oid: record for (k, oid), record in self.state.items() if k == kind}
+
+    async def run(self):
+        await self.restore_roles()
+        await self.restore_channels()
+        await self.restore_emojis()
+        await self.fanout.run("reorder", lambda step: step(), [self.reorder_roles, self.reorder_channels], 1)
+        return self.fanout.summary()
+
+    # roles ------------------------------------------------------------
+    async def restore_roles(self):
+        guild = self.guild
+        records = self._records(ROLE)
+        live = {r.id: serialize_role(r) for r in guild.roles if not r.managed}
+        self.role_ids, missing = _match(records, live, lambda rec: rec["name"])
+
+        async def create(item):
+            oid, rec = item
+            role = await guild.create_role(name=rec["name"], permissions=discord.Permissions(rec["permissions"]),
+                                           colour=rec["color"], hoist=rec["hoist"], mentionable=rec["mentionable"],
+                                           reason=self.reason)
+            self.role_ids[oid] = role.id
+
+        await self.fanout.run("roles", create, missing, ROLE_CONCURRENCY)
+
+        # surviving roles whose permissions were changed (e.g. @everyone handed administrator)
+        top = guild.me.top_role
+        drifted = []
+        for oid, rec in records.items():
+            role = guild.get_role(self.role_ids.get(oid, 0))
+            if role is not None and role < top and role.permissions.value != rec["permissions"]:
+                drifted.append((role, rec))
+
+        async def reset(item):
+            role, rec = item
+            await role.edit(permissions=discord.Permissions(rec["permissions"]), reason=self.reason)
+
+        if drifted:
+            await self.fanout.run("permissions", reset, drifted, ROLE_CONCURRENCY)
+
+    # channels ---------------------------------------------------------
+    def overwrites(self, record):
+        out = {}
+        for target_id, target_type, allow, deny in record["overwrites"]:
+            if target_type == 0:
+                if target_id not in self.role_ids:
+                    continue
+                target = discord.Object(self.role_ids[target_id], type=discord.Role)
+            else:
+                if self.guild.get_member(target_id) is None:
+                    continue
+                target = discord.Object(target_id, type=discord.Member)
+            out[target] = discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+        return out
+
+    async def restore_channels(self):
+        records = self._records(CHANNEL)
+        live = {c.id: serialize_channel(c) for c in self.guild.channels}
+        self.channel_ids, missing = _match(records, live, lambda rec: (rec["name"], rec["type"]))
+        category = discord.ChannelType.category.value
+        await self.fanout.run("categories", self._create_channel,
+                              [m for m in missing if m[1]["type"] == category], CHANNEL_CONCURRENCY)
+        await self.fanout.run("channels", self._create_channel,
+                              [m for m in missing if m[1]["type"] != category], CHANNEL_CONCURRENCY)
+
+    async def _create_channel(self, item):
+        oid, rec = item
+        parent = None
+        if rec.get("category_id") in self.channel_ids:
+            parent_id = self.channel_ids[rec["category_id"]]
+            # categories made a moment ago may not be in the guild cache yet
+            parent = self.categories.get(rec["category_id"]) or self.guild.get_channel(parent_id)
+        channel = await create_channel(self.guild, rec, category=parent, overwrites=self.overwrites(rec),
+                                       reason=self.reason)
+        self.channel_ids[oid] = channel.id
+        if isinstance(channel, discord.CategoryChannel):
+            self.categories[oid] = channel
+
+    # emojis -----------------------------------------------------------
+    async def restore_emojis(self):
+        records = self._records(EMOJI)
+        live = {e.id: serialize_emoji(e) for e in self.guild.emojis}
+        _, missing = _match(records, live, lambda rec: rec["name"])
+
+        async def create(item):
+            oid, rec = item
+            image = await self.fetch_emoji(oid, rec)
+            roles = [discord.Object(self.role_ids[r]) for r in rec["roles"] if r in self.role_ids]
+            await self.guild.create_custom_emoji(name=rec["name"], image=image, roles=roles, reason=self.reason)
+
+        await self.fanout.run("emojis", create, missing, EMOJI_CONCURRENCY)
+
+    # final reorder ----------------------------------------------------
+    async def reorder_roles(self):
+        guild = self.guild
+        top = guild.me.top_role.position
+        records = self._records(ROLE)
+        ordered = []
+        for oid in sorted(records, key=lambda oid: records[oid]["position"]):
+            role = guild.get_role(self.role_ids.get(oid, 0))
+            # anything at or above our top role can't be moved; new roles aren't cached yet
+            if oid == guild.id or (role is not None and role.position >= top):
+                continue
+            if oid in self.role_ids:
+                ordered.append(self.role_ids[oid])
+        ordered = ordered[-(top - 1):] if top > 1 else []
+        if ordered:
+            await guild.edit_role_positions({discord.Object(rid): pos for pos, rid in enumerate(ordered, start=1)},
+                                            reason=self.reason)
+
+    async def reorder_channels(self):
+        payload = []
+        for oid, rec in self._records(CHANNEL).items():
+            if oid not in self.channel_ids:
+                continue
+            entry = {"id": self.channel_ids[oid], "position": rec["position"]}
+            if rec["type"] != discord.ChannelType.category.value:
+                entry["parent_id"] = self.channel_ids.get(rec.get("category_id"))
+            payload.append(entry)
+        if payload:
+            await self.http.bulk_channel_update(self.guild.id, payload, reason=self.reason)
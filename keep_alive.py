@@ -1,15 +1,102 @@
-from flask import Flask, render_template 
-from threading import Thread
+import math
+import time
 
-app = Flask(__name__)
+from aiohttp import web
 
-@app.route('/')
-def index():
-    return "Alive"
+# =========================
+# Keep-alive / health server
+# =========================
+# Runs on the bot's own event loop (started from setup_hook), so a ping is
+# just another coroutine instead of a Flask thread fighting the gateway for
+# the GIL. Routes:
+#   /         "Alive", for uptime pingers
+#   /health   liveness: answers as long as the loop is turning
+#   /ready    readiness: 200 only while the gateway is connected, READY and
+#             heartbeating under `max_latency`, 503 otherwise
+#   /metrics  Prometheus text, if a renderer was given
 
-def run():
-  app.run(host='0.0.0.0',port=8080)
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
 
-def keep_alive():  
-    t = Thread(target=run)
-    t.start()
+
+class KeepAlive:
+    def __init__(self, bot, host: str = "0.0.0.0", port: int = 8080, metrics=None, max_latency: float = 5.0):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.metrics = metrics          # fn() -> Prometheus text
+        self.max_latency = max_latency
+        self.started = time.monotonic()
+        self.connected = False
+        self.changed_at = None          # monotonic time of the last connect/disconnect
+        self.disconnects = 0
+        self._runner = None
+
+        # the gateway tells us when it drops; is_ready() alone stays True
+        # across reconnects
+        bot.add_listener(self._on_connect, "on_connect")
+        bot.add_listener(self._on_connect, "on_resumed")
+        bot.add_listener(self._on_disconnect, "on_disconnect")
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/", self.index),
+            web.get("/health", self.health),
+            web.get("/ready", self.ready),
+            web.get("/metrics", self.render_metrics),
+        ])
+
+    async def _on_connect(self):
+        if not self.connected:
+            self.connected = True
+            self.changed_at = time.monotonic()
+
+    async def _on_disconnect(self):
+        if self.connected:
+            self.connected = False
+            self.changed_at = time.monotonic()
+            self.disconnects += 1
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        runner, self._runner = self._runner, None
+        if runner is not None:
+            await runner.cleanup()
+
+    def state(self):
+        """(ready, details) for the readiness probe."""
+        latency = self.bot.latency
+        latency_ok = math.isfinite(latency) and latency < self.max_latency
+        ready = self.connected and self.bot.is_ready() and not self.bot.is_closed() and latency_ok
+        now = time.monotonic()
+        return ready, {
+            "ready": ready,
+            "connected": self.connected,
+            "gateway_ready": self.bot.is_ready(),
+            "latency_ms": round(latency * 1000, 1) if math.isfinite(latency) else None,
+            "guilds": len(self.bot.guilds),
+            "disconnects": self.disconnects,
+            "state_for_s": round(now - self.changed_at, 1) if self.changed_at is not None else None,
+            "uptime_s": round(now - self.started, 1),
+        }
+
+    async def index(self, _request):
+        return web.Response(text="Alive")
+
+    async def health(self, _request):
+        _, details = self.state()
+        return web.json_response(details)
+
+    async def ready(self, _request):
+        ready, details = self.state()
+        return web.json_response(details, status=200 if ready else 503)
+
+    async def render_metrics(self, _request):
+        if self.metrics is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.metrics().encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
@@ -0,0 +1,155 @@
+import asyncio
+from collections import deque
+
+import discord
+
+# =========================
+# Background log pipeline
+# =========================
+# Event handlers drop embeds into a per-guild queue and return immediately.
+# One background task packs them into messages of up to 10 embeds and sends
+# them on a timer, so bursts cost a handful of API calls instead of hundreds.
+
+LOW, NORMAL, HIGH = 0, 1, 2
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000   # Discord's combined limit for one message
+
+
+class GuildLogQueue:
+    def __init__(self, guild):
+        self.guild = guild
+        self.items = deque()        # (priority, embed)
+        self.dropped = 0            # low-priority events shed since last flush
+
+
+class LogDispatcher:
+    def __init__(self, channel_id: int, max_queue: int = 200, interval: float = 2.0,
+                 messages_per_flush: int = 5):
+        self.channel_id = channel_id
+        self.max_queue = max_queue
+        self.interval = interval
+        self.messages_per_flush = messages_per_flush
+        self.queues = {}            # guild_id -> GuildLogQueue
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.failed_messages = 0    # sends that errored (or had no channel to go to)
+        self.failed_embeds = 0
+        self.dropped = 0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def depth(self) -> int:
+        return sum(len(q.items) for q in self.queues.values())
+
+    def submit(self, guild, embed: discord.Embed, priority: int = NORMAL):
+        """Queue an embed for the guild's log channel. Never blocks."""
+        if guild is None:
+            return
+        queue = self.queues.get(guild.id)
+        if queue is None:
+            queue = self.queues[guild.id] = GuildLogQueue(guild)
+        queue.guild = guild
+
+        if len(queue.items) >= self.max_queue:
+            if priority == LOW:
+                queue.dropped += 1
+                self.dropped += 1
+                return
+            # make room by shedding the oldest low-priority entry
+            for i, (prio, _) in enumerate(queue.items):
+                if prio == LOW:
+                    del queue.items[i]
+                    queue.dropped += 1
+                    self.dropped += 1
+                    break
+            else:
+                # nothing cheap to shed; important events may overrun up to 2x
+                if len(queue.items) >= self.max_queue * 2:
+                    queue.items.popleft()
+                    queue.dropped += 1
+                    self.dropped += 1
+        queue.items.append((priority, embed))
+        if len(queue.items) >= MAX_EMBEDS_PER_MESSAGE:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # last best-effort flush so shutdown doesn't swallow queued logs
+        await self.flush(drain=True)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print("log dispatcher error:", e)
+
+    async def flush(self, drain: bool = False):
+        limit = None if drain else self.messages_per_flush
+        await asyncio.gather(*(self._flush_guild(q, limit) for q in list(self.queues.values()) if q.items or q.dropped))
+
+    def _next_batch(self, queue):
+        """Up to one message worth of (priority, embed) pairs off the queue."""
+        batch, chars = [], 0
+        if queue.dropped:
+            summary = discord.Embed(
+                title="⚠️ Log Overflow",
+                description=f"{queue.dropped} low-priority event(s) were skipped during a burst.",
+                color=discord.Color.dark_grey()
+            )
+            queue.dropped = 0
+            batch.append((NORMAL, summary))
+            chars += len(summary)
+        while queue.items and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            size = len(queue.items[0][1])
+            if batch and chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            batch.append(queue.items.popleft())
+            chars += size
+        return batch
+
+    def _failed(self, queue, batch, reason):
+        self.failed_messages += 1
+        self.failed_embeds += len(batch)
+        print(f"log dispatcher: dropped {len(batch)} embed(s) for guild {queue.guild.id}: {reason}")
+
+    async def _flush_guild(self, queue, limit):
+        channel = queue.guild.get_channel(self.channel_id)
+        sent = 0
+        while (queue.items or queue.dropped) and (limit is None or sent < limit):
+            batch = self._next_batch(queue)
+            if channel is None:
+                self._failed(queue, batch, "log channel not found")
+                continue
+            try:
+                await channel.send(embeds=[embed for _, embed in batch])
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    # still rate limited after discord.py's own retries: put
+                    # the batch back in front and try again next flush
+                    queue.items.extendleft(reversed(batch))
+                    return
+                self._failed(queue, batch, e)
+            except Exception as e:
+                self._failed(queue, batch, e)
+            else:
+                self.sent_messages += 1
+                self.sent_embeds += len(batch)
+            sent += 1
@@ -1,16 +1,32 @@
 import os
 import sqlite3
-import aiosqlite
 import discord
 from discord.ext import commands
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from collections import defaultdict
-from keep_alive import keep_alive
+from keep_alive import KeepAlive
 import asyncio
+import typing
 from discord.ui import View, Button
 import aiohttp
 import random
+import time
 from discord.ui import View, Select
+from storage import Database, BatchWriter
+from migrations import migrate, CASES_MIGRATIONS, BOT_MIGRATIONS
+import log_dispatcher
+from log_dispatcher import LogDispatcher
+from pipeline import Pipeline
+from automod import SpamTracker, ContentFilter
+from scheduler import Scheduler, parse_duration, format_duration
+from concurrency import FanOut
+from audit_log import AuditLogResolver
+import guild_snapshot
+from emoji_cache import EmojiCache
+from role_index import RoleIndex, MissingRole
+from message_store import MessageStore, StoredMessage
+from metrics import Registry
+from profiler import LoopWatchdog, HandlerProfiler
 
 # =========================
 # CONFIG / IDS
@@ -23,57 +39,141 @@ ANTINUKE_ROLE_ID = 1418641632236011669
 LOG_CHANNEL_ID = 1418641633750159493
 WHITELIST_ROLE_ID = 1418641632236011667
 
-# storage for ephemeral features
-removed_roles = {}            # for rape/recover command
-spam_tracker = defaultdict(list)  # anti-spam tracker
 
 DB_PATH = "roles.db"
 
+# =========================
+# METRICS (served on /metrics by the keep-alive server)
+# =========================
+# gauges read their value at scrape time, so the lambdas below can point at
+# objects defined further down
+metrics = Registry()
+event_latency = metrics.histogram("discord_event_handler_seconds", "Time spent in each event handler", ("event", "handler"))
+command_latency = metrics.histogram("discord_command_seconds", "Time spent running each command", ("command",))
+automod_hits = metrics.counter("automod_hits_total", "Messages caught by automod", ("rule",))
+db_wait = metrics.histogram("db_pool_wait_seconds", "Time spent waiting for a pooled SQLite connection", ("db",))
+db_query = metrics.histogram("db_query_seconds", "Time a pooled SQLite connection was held", ("db",))
+rate_limits = metrics.counter("discord_http_429_total", "Rate limited responses from the Discord API", ("scope",))
+metrics.gauge("discord_gateway_latency_seconds", "Heartbeat round trip of the gateway connection", fn=lambda: bot.latency)
+metrics.gauge("discord_guilds", "Guilds the bot is in", fn=lambda: len(bot.guilds))
+metrics.gauge("log_queue_depth", "Log embeds waiting to be sent", fn=lambda: log_queue.depth())
+metrics.counter("log_queue_dropped_total", "Log embeds shed because a guild queue was full", fn=lambda: log_queue.dropped)
+metrics.counter("log_messages_sent_total", "Messages sent by the log dispatcher", fn=lambda: log_queue.sent_messages)
+metrics.counter("log_embeds_sent_total", "Embeds sent by the log dispatcher", fn=lambda: log_queue.sent_embeds)
+metrics.counter("log_messages_failed_total", "Log messages that could not be sent", fn=lambda: log_queue.failed_messages)
+metrics.counter("log_embeds_failed_total", "Log embeds lost to failed sends", fn=lambda: log_queue.failed_embeds)
+metrics.gauge("db_write_queue_depth", "Rows waiting in a write-behind batch", ("db",),
+              fn=lambda: {(CASE_DB,): case_writer.pending(), (BOT_DB,): archive_writer.pending()})
+
+
+def batch_flush_stat(attr):
+    return lambda: {(w.path,): getattr(w.stats, attr) for w in (case_writer, archive_writer)}
+
+metrics.counter("db_batch_flushes_total", "Write-behind batches committed", ("db",), fn=batch_flush_stat("batches"))
+metrics.counter("db_batch_rows_total", "Rows written by write-behind batches", ("db",), fn=batch_flush_stat("rows"))
+metrics.counter("db_batch_commit_seconds_total", "Time spent committing write-behind batches", ("db",),
+                fn=batch_flush_stat("commit_seconds"))
+metrics.counter("db_batch_fsync_saved_seconds_total", "Estimated commit time saved by batching rows", ("db",),
+                fn=batch_flush_stat("fsync_saved_seconds"))
+metrics.counter("message_pipeline_errors_total", "on_message stages that raised", ("stage",),
+                fn=lambda: {(name,): st.errors for name, st in message_pipeline.stats.items()})
+metrics.counter("audit_log_fetches_total", "Audit log pages fetched to attribute deletions",
+                fn=lambda: audit_resolver.fetches)
+metrics.gauge("message_store_bytes", "Approximate size of the recent message store", fn=lambda: message_store.bytes)
+metrics.counter("message_store_evictions_total", "Messages pushed out of the recent message store",
+                fn=lambda: message_store.evictions)
+metrics.gauge("event_loop_lag_seconds", "How late the event loop woke from its last watchdog sleep", fn=lambda: loop_watchdog.lag)
+metrics.counter("event_loop_stalls_total", "Times the event loop was blocked past the watchdog threshold",
+                fn=lambda: loop_watchdog.stalls)
+
+
+def observe_db(path, wait_s, held_s):
+    db_wait.observe(wait_s, path)
+    db_query.observe(held_s, path)
+
+
+async def on_http_request_end(session, ctx, params):
+    if params.response.status == 429:
+        # user / global / shared, per Discord's rate limit headers
+        rate_limits.inc(params.response.headers.get("X-RateLimit-Scope", "unknown"))
+
+http_trace = aiohttp.TraceConfig()
+http_trace.on_request_end.append(on_http_request_end)
+
+# =========================
+# PROFILING (loop lag + slow handlers, see $handler-stats)
+# =========================
+# the watchdog prints the loop thread's stack when the loop is stuck for
+# 250ms+; handlers still running after 2s get printed with their await chain
+loop_watchdog = LoopWatchdog(interval=0.1, threshold=0.25)
+profiler = HandlerProfiler(slow_threshold=2.0)
+
 # =========================
 # DATABASE (cases table) - safe init with integrity check
 # =========================
 CASE_DB = "cases.db"
+BOT_DB = "bot.db"
 
-async def setup_cases_db():
-    async with aiosqlite.connect(CASE_DB) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS cases (
-                case_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                guild_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                moderator_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                reason TEXT,
-                timestamp TEXT
-            )
-        """)
-        await db.commit()
+# persistent pooled connections, opened in on_ready / closed in Bot.close
+db_pool = Database(observe=observe_db)
+# groups case inserts into one transaction (flushes every 50ms or 50 rows)
+case_writer = BatchWriter(db_pool, CASE_DB, max_rows=50, max_delay=0.05)
 
-
-async def add_case(guild_id: int, user_id: int, moderator_id: int, action: str, reason: str):
-    ts = datetime.now(timezone.utc).isoformat()
-    async with aiosqlite.connect(CASE_DB) as db:
-        await db.execute(
-            "INSERT INTO cases (guild_id, user_id, moderator_id, action, reason, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-            (guild_id, user_id, moderator_id, action, reason, ts)
-        )
-        await db.commit()
-        async with db.execute("SELECT last_insert_rowid()") as cur:
-            row = await cur.fetchone()
-            return row[0] if row else None
+CASE_ACTIONS = ("Warn", "Mute", "Kick", "Ban")
 
 
-async def get_user_cases(guild_id: int, user_id: int):
-    async with aiosqlite.connect(CASE_DB) as db:
+async def get_case_counts(guild_id: int, user_id: int):
+    counts = dict.fromkeys(CASE_ACTIONS, 0)
+    async with db_pool.acquire(CASE_DB) as db:
         async with db.execute(
-            "SELECT case_id, moderator_id, action, reason, timestamp FROM cases WHERE guild_id = ? AND user_id = ? ORDER BY case_id ASC",
+            "SELECT action, count FROM case_counts WHERE guild_id = ? AND user_id = ?",
             (guild_id, user_id)
         ) as cur:
-            return await cur.fetchall()
+            for action, count in await cur.fetchall():
+                counts[action] = count
+    return counts
+
+
+async def add_case(guild_id: int, user_id: int, moderator_id: int, action: str, reason: str):
+    ts = datetime.now(timezone.utc).isoformat()
+    return await case_writer.submit(
+        "INSERT INTO cases (guild_id, user_id, moderator_id, action, reason, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+        (guild_id, user_id, moderator_id, action, reason, ts)
+    )
+
+
+async def get_user_cases(guild_id: int, user_id: int, *, after: int = None, before: int = None,
+                         limit: int = 10, action: str = None, since: str = None, until: str = None):
+    """One page of a member's cases, keyset-paginated on case_id (ascending).
+    after/before are exclusive case_id bounds; since/until are ISO timestamps."""
+    sql = "SELECT case_id, moderator_id, action, reason, timestamp FROM cases WHERE guild_id = ? AND user_id = ?"
+    params = [guild_id, user_id]
+    if action:
+        sql += " AND action = ?"
+        params.append(action)
+    if after is not None:
+        sql += " AND case_id > ?"
+        params.append(after)
+    if before is not None:
+        sql += " AND case_id < ?"
+        params.append(before)
+    if since:
+        sql += " AND timestamp >= ?"
+        params.append(since)
+    if until:
+        sql += " AND timestamp < ?"
+        params.append(until)
+    # walking backwards means reading the index in reverse, then flipping the page
+    sql += " ORDER BY case_id DESC LIMIT ?" if before is not None else " ORDER BY case_id ASC LIMIT ?"
+    params.append(limit)
+    async with db_pool.acquire(CASE_DB) as db:
+        async with db.execute(sql, params) as cur:
+            rows = await cur.fetchall()
+    return rows[::-1] if before is not None else rows
 
 
 async def get_case_by_id(guild_id: int, case_id: int):
-    async with aiosqlite.connect(CASE_DB) as db:
+    async with db_pool.acquire(CASE_DB) as db:
         async with db.execute(
             "SELECT case_id, guild_id, user_id, moderator_id, action, reason, timestamp FROM cases WHERE case_id = ? AND guild_id = ?",
             (case_id, guild_id)
@@ -82,7 +182,7 @@ async def get_case_by_id(guild_id: int, case_id: int):
 
 
 async def remove_case(case_id: int):
-    async with aiosqlite.connect(CASE_DB) as db:
+    async with db_pool.acquire(CASE_DB) as db:
         await db.execute("DELETE FROM cases WHERE case_id = ?", (case_id,))
         await db.commit()
         
@@ -91,22 +191,122 @@ async def remove_case(case_id: int):
 # =========================
 intents = discord.Intents.all()
 
+class Bot(commands.Bot):
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        # every @bot.event handler and bot.listen() listener is run through
+        # here by discord.py, so this is the one place to time them all
+        name = event_name if coro.__name__ == event_name else f"{event_name}:{coro.__name__}"
+        start = time.perf_counter()
+        try:
+            async with profiler.track("event", name):
+                await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            event_latency.observe(time.perf_counter() - start, event_name, coro.__name__)
+
+    async def invoke(self, ctx):
+        # same for commands: checks, converters and the callback itself
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        name = ctx.command.qualified_name
+        start = time.perf_counter()
+        try:
+            async with profiler.track("command", name):
+                await super().invoke(ctx)
+        finally:
+            command_latency.observe(time.perf_counter() - start, name)
+
+    async def setup_hook(self):
+        loop_watchdog.start()
+        # health/metrics HTTP server, on this loop
+        await keep_alive.start()
+        # dispatches help menu selections from messages sent before a restart
+        self.add_view(HelpView([HELP_DEFAULT_CATEGORY]))
+
+    async def close(self):
+        await log_queue.stop()
+        await reminder_scheduler.stop()
+        if guild_snapshot_task is not None:
+            guild_snapshot_task.cancel()
+        await super().close()
+        await keep_alive.stop()
+        await loop_watchdog.stop()
+        await case_writer.stop()
+        await archive_writer.stop()
+        await db_pool.close()
+
+
 # multiple prefixes ($ and /), plus mention
-bot = commands.Bot(
+bot = Bot(
     command_prefix=commands.when_mentioned_or("$"),
-    intents=intents
+    intents=intents,
+    http_trace=http_trace,
 )
 
+# uptime pings, /ready for the host's health check, /metrics for Prometheus
+keep_alive = KeepAlive(bot, port=int(os.getenv("PORT", 8080)), metrics=metrics.render)
+
 # remove default help to use custom one
 try:
     bot.remove_command("help")
 except Exception:
     pass
 
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, MissingRole):
+        return  # the check already replied
+    await commands.Bot.on_command_error(bot, ctx, error)
+
+# =========================
+# ROLE INDEX
+# =========================
+# name -> role per guild plus the configured special roles; commands use
+# @role_index.require(key) instead of scanning ctx.author.roles
+role_index = RoleIndex()
+role_index.define("muted", "Muted")
+role_index.define("antinuke", ANTINUKE_ROLE_ID)
+
+
+@bot.listen("on_guild_role_create")
+async def role_index_create(role):
+    role_index.add(role)
+
+
+@bot.listen("on_guild_role_update")
+async def role_index_update(before, after):
+    role_index.update(before, after)
+
+
+@bot.listen("on_guild_role_delete")
+async def role_index_delete(role):
+    role_index.remove(role)
+
+
+@bot.listen("on_guild_remove")
+async def role_index_forget(guild):
+    role_index.forget(guild.id)
+
 @bot.event
 async def on_ready():
+    # open pooled connections first, every DB helper goes through them
+    await db_pool.open(CASE_DB, BOT_DB)
     # ensure DB and tables exist (and recreate if needed)
     await setup_database()  # <- yahan DB setup call kiya
+    await antinuke_cache.load()
+    await load_automod_config()
+    await load_reminders()
+    await load_afk()
+    await load_suggestions()
+    case_writer.start()
+    archive_writer.start()
+    log_queue.start()
+    reminder_scheduler.start()
+    global guild_snapshot_task
+    if guild_snapshot_task is None:
+        guild_snapshot_task = asyncio.create_task(guild_snapshot_loop())
+        await emoji_cache.load()
+        asyncio.create_task(refresh_emoji_caches())
     print(f'✅ Logged in as {bot.user} ({bot.user.id})')
     
 # =========================
@@ -129,46 +329,259 @@ async def on_member_join(member):
 # =========================
 # EXTENDED LOGGING SYSTEM (All Activities except Guild Events)
 # =========================
-async def send_log(guild, embed: discord.Embed):
-    try:
-        log_channel = guild.get_channel(log_channel_id)
-        if log_channel:
-            await log_channel.send(embed=embed)
-    except Exception:
-        pass
+# embeds are queued per guild and sent in packs of up to 10 by a background
+# task; LOW priority events are the first to go when a queue overflows
+log_queue = LogDispatcher(log_channel_id)
+
+async def send_log(guild, embed: discord.Embed, priority: int = log_dispatcher.NORMAL):
+    log_queue.submit(guild, embed, priority)
+
+
+async def log_command(ctx, description: str, color: discord.Color):
+    embed = discord.Embed(
+        title=f"🛠️ Command: {ctx.command}",
+        description=description,
+        color=color,
+        timestamp=datetime.now(timezone.utc)
+    )
+    embed.set_footer(text=f"By {ctx.author} ({ctx.author.id})")
+    await send_log(ctx.guild, embed, log_dispatcher.HIGH)
+
+
+# -------------------------
+# Deleted message archive
+# -------------------------
+# deleted messages go to bot.db through a write-behind buffer (one
+# transaction per second or per 200 rows); each guild keeps at most
+# ARCHIVE_MAX_PER_GUILD rows, none older than ARCHIVE_MAX_AGE_DAYS
+ARCHIVE_MAX_PER_GUILD = 5000
+ARCHIVE_MAX_AGE_DAYS = 30
+ARCHIVE_PRUNE_EVERY = 200     # captures per guild between retention passes
+archive_writer = BatchWriter(db_pool, BOT_DB, max_rows=200, max_delay=1.0)
+archive_since_prune = defaultdict(int)   # guild_id -> captures since last prune
+
+
+def archive_message(record):
+    """record: a StoredMessage (see the recent message store below)"""
+    archive_writer.enqueue(
+        "INSERT OR IGNORE INTO deleted_messages (guild_id, channel_id, message_id, author_id, content, attachments, timestamp) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (record.guild_id, record.channel_id, record.id, record.author_id, record.content,
+         record.attachments, datetime.now(timezone.utc).isoformat())
+    )
+    archive_since_prune[record.guild_id] += 1
+    if archive_since_prune[record.guild_id] >= ARCHIVE_PRUNE_EVERY:
+        archive_since_prune[record.guild_id] = 0
+        prune_archive(record.guild_id)
+
+
+def prune_archive(guild_id):
+    # queued behind the inserts, so it sees every row captured so far
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=ARCHIVE_MAX_AGE_DAYS)).isoformat()
+    archive_writer.enqueue("DELETE FROM deleted_messages WHERE guild_id = ? AND timestamp < ?", (guild_id, cutoff))
+    archive_writer.enqueue(
+        "DELETE FROM deleted_messages WHERE guild_id = ? AND timestamp <= ("
+        "SELECT timestamp FROM deleted_messages WHERE guild_id = ? ORDER BY timestamp DESC LIMIT 1 OFFSET ?)",
+        (guild_id, guild_id, ARCHIVE_MAX_PER_GUILD)
+    )
+
+
+async def archived_messages(guild_id, *, channel_id=None, author_id=None, limit=10):
+    """Newest first; exactly one of channel_id / author_id."""
+    if channel_id is not None:
+        sql = ("SELECT message_id, author_id, content, attachments, timestamp FROM deleted_messages "
+               "WHERE guild_id = ? AND channel_id = ? ORDER BY timestamp DESC LIMIT ?")
+        params = (guild_id, channel_id, limit)
+    else:
+        sql = ("SELECT message_id, channel_id, content, attachments, timestamp FROM deleted_messages "
+               "WHERE guild_id = ? AND author_id = ? ORDER BY timestamp DESC LIMIT ?")
+        params = (guild_id, author_id, limit)
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute(sql, params) as cur:
+            return await cur.fetchall()
+
+
+def archive_embed(title, rows, label):
+    """label(row) -> who/where line for one archived message."""
+    embed = discord.Embed(title=title, color=discord.Color.dark_red())
+    for _message_id, other_id, content, attachments, deleted_at in rows:
+        text = (content or "*Empty*")[:900]
+        if attachments:
+            text += "\n📎 " + " ".join(attachments.split("\n"))[:100]
+        embed.add_field(name=f"{label(other_id)} • {deleted_at[:16].replace('T', ' ')} UTC", value=text, inline=False)
+    return embed
+
+
+@bot.command(name="snipe", help="Recently deleted messages in a channel. Usage: $snipe [#channel] [count]")
+@commands.has_permissions(manage_messages=True)
+async def snipe(ctx, channel: typing.Optional[discord.TextChannel] = None, count: int = 1):
+    channel = channel or ctx.channel
+    rows = await archived_messages(ctx.guild.id, channel_id=channel.id, limit=max(1, min(count, 10)))
+    if not rows:
+        return await ctx.send(f"❌ Nothing deleted in {channel.mention} is archived.")
+    await ctx.send(embed=archive_embed(f"🗑️ Deleted in #{channel.name}", rows, lambda uid: str(ctx.guild.get_member(uid) or uid)))
+
+
+@bot.command(name="snipe-user", help="Recently deleted messages by a user. Usage: $snipe-user @user [count]")
+@commands.has_permissions(manage_messages=True)
+async def snipe_user(ctx, user: discord.User, count: int = 5):
+    rows = await archived_messages(ctx.guild.id, author_id=user.id, limit=max(1, min(count, 10)))
+    if not rows:
+        return await ctx.send(f"❌ No archived deleted messages from {user.mention}.")
+    await ctx.send(embed=archive_embed(f"🗑️ Deleted messages by {user}", rows, lambda cid: f"#{getattr(ctx.guild.get_channel(cid), 'name', cid)}"))
+
+
+# -------------------------
+# Recent message store
+# -------------------------
+# discord.py's own cache only covers the last 1000 messages since startup,
+# so delete/edit logging runs on raw events and looks content up here:
+# a byte-capped per-guild LRU (message_store.py). With MESSAGE_SPILL=1 in the
+# environment, evicted messages go to bot.db (message_spill) for
+# MESSAGE_SPILL_MAX_AGE; off by default, it keeps message bodies on disk.
+MESSAGE_STORE_BYTES = 32 * 1024 * 1024
+MESSAGE_STORE_GUILD_BYTES = 4 * 1024 * 1024
+MESSAGE_SPILL = os.getenv("MESSAGE_SPILL") == "1"
+MESSAGE_SPILL_MAX_AGE = 7 * 86400
+MESSAGE_SPILL_PRUNE_EVERY = 1000    # spilled rows between retention passes
+spilled_since_prune = 0
+
+
+def spill_messages(records):
+    global spilled_since_prune
+    for r in records:
+        archive_writer.enqueue(
+            "INSERT OR REPLACE INTO message_spill (message_id, guild_id, channel_id, author_id, content, attachments, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (r.id, r.guild_id, r.channel_id, r.author_id, r.content, r.attachments, r.created_at)
+        )
+    spilled_since_prune += len(records)
+    if spilled_since_prune >= MESSAGE_SPILL_PRUNE_EVERY:
+        spilled_since_prune = 0
+        cutoff = datetime.now(timezone.utc).timestamp() - MESSAGE_SPILL_MAX_AGE
+        archive_writer.enqueue("DELETE FROM message_spill WHERE created_at < ?", (cutoff,))
+
+
+message_store = MessageStore(MESSAGE_STORE_BYTES, MESSAGE_STORE_GUILD_BYTES,
+                             on_evict=spill_messages if MESSAGE_SPILL else None)
+
+
+async def store_stage(view):
+    if view.guild is not None:
+        message_store.add(StoredMessage.from_message(view.message))
+    return False
+
+
+async def find_messages(guild_id, message_ids, cached=None, *, remove=False):
+    """{message_id: StoredMessage} for raw events: our LRU, discord.py's cache,
+    then one query against the spill table for whatever is still missing."""
+    cached = cached or {}
+    found = {}
+    for message_id in message_ids:
+        record = message_store.pop(guild_id, message_id) if remove else message_store.get(guild_id, message_id)
+        message = cached.get(message_id)
+        if record is None and message is not None and not message.author.bot:
+            record = StoredMessage.from_message(message)
+        if record is not None:
+            found[message_id] = record
+    missing = [i for i in message_ids if i not in found and i not in cached]
+    if missing and MESSAGE_SPILL:
+        marks = ", ".join("?" * len(missing))
+        async with db_pool.acquire(BOT_DB) as db:
+            async with db.execute(
+                "SELECT message_id, guild_id, channel_id, author_id, content, attachments, created_at "
+                f"FROM message_spill WHERE message_id IN ({marks})",
+                missing
+            ) as cur:
+                for row in await cur.fetchall():
+                    found[row[0]] = StoredMessage(*row)
+        if remove:
+            archive_writer.enqueue(f"DELETE FROM message_spill WHERE message_id IN ({marks})", missing)
+    return found
+
+
+async def find_message(guild_id, message_id, cached=None, *, remove=False):
+    found = await find_messages(guild_id, (message_id,), {message_id: cached} if cached is not None else None,
+                                remove=remove)
+    return found.get(message_id)
+
+
+@bot.listen("on_guild_remove")
+async def message_store_forget(guild):
+    message_store.forget_guild(guild.id)
 
 
 # -------------------------
 # Messages
 # -------------------------
 @bot.event
-async def on_message_delete(message):
-    if message.author.bot: return
+async def on_raw_message_delete(payload):
+    if payload.guild_id is None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    record = await find_message(payload.guild_id, payload.message_id, payload.cached_message, remove=True)
+    if guild is None or (record is None and payload.cached_message is not None):
+        return  # a bot's message
     embed = discord.Embed(
         title="🗑️ Message Deleted",  # fa-trash
         color=discord.Color.red(),
         timestamp=datetime.now(timezone.utc)
     )
-    embed.add_field(name="User", value=message.author.mention, inline=False)
-    embed.add_field(name="Channel", value=message.channel.mention, inline=False)
-    embed.add_field(name="Content", value=message.content or "*Empty*", inline=False)
-    await send_log(message.guild, embed)
+    embed.add_field(name="User", value=f"<@{record.author_id}>" if record else "*Unknown*", inline=False)
+    embed.add_field(name="Channel", value=f"<#{payload.channel_id}>", inline=False)
+    # field values cap at 1024 chars; one oversized embed would sink its whole log batch
+    embed.add_field(name="Content", value=(record.content or "*Empty*")[:1024] if record else "*Not cached*", inline=False)
+    await send_log(guild, embed, log_dispatcher.NORMAL if record else log_dispatcher.LOW)
+    if record is not None:
+        archive_message(record)
+
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    if payload.guild_id is None:
+        return
+    cached = {m.id: m for m in payload.cached_messages}
+    found = await find_messages(payload.guild_id, list(payload.message_ids), cached, remove=True)
+    for record in found.values():
+        archive_message(record)
+    archived = len(found)
+    guild = bot.get_guild(payload.guild_id)
+    if guild is not None:
+        embed = discord.Embed(
+            title="🗑️ Messages Bulk Deleted",
+            description=f"{len(payload.message_ids)} messages deleted in <#{payload.channel_id}> ({archived} archived, see `$snipe`).",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        await send_log(guild, embed)
 
 
 @bot.event
-async def on_message_edit(before, after):
-    if before.author.bot: return
-    if before.content == after.content: return
+async def on_raw_message_edit(payload):
+    data = payload.data
+    if payload.guild_id is None or "content" not in data or data.get("author", {}).get("bot"):
+        return
+    before = await find_message(payload.guild_id, payload.message_id, payload.cached_message)
+    after = data["content"]
+    if before is not None and before.content == after:
+        return  # embed unfurl / pin, not a content edit
+    guild = bot.get_guild(payload.guild_id)
+    before_content = before.content if before else None
+    author_id = before.author_id if before else data.get("author", {}).get("id")
+    if before is not None:
+        message_store.edit(before, after)
+    if guild is None:
+        return
     embed = discord.Embed(
         title="✏️ Message Edited",  # fa-pencil-alt
         color=discord.Color.orange(),
         timestamp=datetime.now(timezone.utc)
     )
-    embed.add_field(name="User", value=before.author.mention, inline=False)
-    embed.add_field(name="Channel", value=before.channel.mention, inline=False)
-    embed.add_field(name="Before", value=before.content or "*Empty*", inline=False)
-    embed.add_field(name="After", value=after.content or "*Empty*", inline=False)
-    await send_log(before.guild, embed)
+    embed.add_field(name="User", value=f"<@{author_id}>", inline=False)
+    embed.add_field(name="Channel", value=f"<#{payload.channel_id}>", inline=False)
+    embed.add_field(name="Before", value=(before_content or "*Empty*")[:1024] if before else "*Not cached*", inline=False)
+    embed.add_field(name="After", value=(after or "*Empty*")[:1024], inline=False)
+    await send_log(guild, embed, log_dispatcher.LOW)
 
 
 # -------------------------
@@ -205,7 +618,7 @@ async def on_member_ban(guild, user):
         color=discord.Color.dark_red(),
         timestamp=datetime.now(timezone.utc)
     )
-    await send_log(guild, embed)
+    await send_log(guild, embed, log_dispatcher.HIGH)
 
 
 @bot.event
@@ -237,7 +650,7 @@ async def on_member_update(before, after):
         embed.add_field(name="Roles Before", value=before_roles or "None", inline=False)
         embed.add_field(name="Roles After", value=after_roles or "None", inline=False)
 
-    await send_log(after.guild, embed)
+    await send_log(after.guild, embed, log_dispatcher.LOW)
 
 
 # -------------------------
@@ -265,7 +678,7 @@ async def on_voice_state_update(member, before, after):
             color=color,
             timestamp=datetime.now(timezone.utc)
         )
-        await send_log(member.guild, embed)
+        await send_log(member.guild, embed, log_dispatcher.LOW)
 
     # Mute/deafen/stream/video changes
     changes = []
@@ -285,7 +698,7 @@ async def on_voice_state_update(member, before, after):
             color=discord.Color.blurple(),
             timestamp=datetime.now(timezone.utc)
         )
-        await send_log(member.guild, embed)
+        await send_log(member.guild, embed, log_dispatcher.LOW)
 
 
 # -------------------------
@@ -370,322 +783,637 @@ async def on_guild_role_update(before, after):
 # =========================
 # AutoMod (Wick-style)
 # =========================
-spam_tracker = defaultdict(list)
-mention_tracker = defaultdict(list)
+# per (guild, user) sliding window, default 5 msgs in 5 sec; idle authors are swept
+spam_tracker = SpamTracker(limit=5, window=5.0)
+# invite domains + per-guild banned words/regexes, compiled into one pattern per guild
+content_filter = ContentFilter()
 
-@bot.event
-async def on_message(message):
-    if message.author.bot:
-        return
 
-    now = datetime.now(timezone.utc).timestamp()
+class MessageView:
+    """Everything the message stages need, read off the message once."""
+    __slots__ = ("message", "guild", "author", "channel", "content", "mentions", "now")
 
-    # =========================
-    # Anti-Spam
-    # =========================
-    last_times = spam_tracker[message.author.id]
-    spam_tracker[message.author.id] = [t for t in last_times if now - t < 5]
-    spam_tracker[message.author.id].append(now)
+    def __init__(self, message):
+        self.message = message
+        self.guild = message.guild
+        self.author = message.author
+        self.channel = message.channel
+        self.content = message.content
+        self.mentions = message.mentions
+        self.now = datetime.now(timezone.utc).timestamp()
 
-    if len(spam_tracker[message.author.id]) >= 5:  # 5 msgs in 5 sec
-        mute_role = discord.utils.get(message.guild.roles, name="Muted")
+
+def automod_embed(view, title, color, action, reason):
+    embed = discord.Embed(title=title, color=color, timestamp=datetime.now(timezone.utc))
+    embed.set_author(name=str(view.author), icon_url=view.author.display_avatar.url)
+    embed.add_field(name="User", value=view.author.mention, inline=False)
+    embed.add_field(name="Action", value=action, inline=True)
+    embed.add_field(name="Reason", value=reason, inline=True)
+    embed.add_field(name="Channel", value=view.channel.mention, inline=False)
+    embed.set_footer(text=f"User ID: {view.author.id}")
+    return embed
+
+
+# =========================
+# Anti-Spam
+# =========================
+async def automod_spam(view):
+    if view.guild is None:
+        return False
+    if spam_tracker.hit(view.guild.id, view.author.id, view.now):
+        automod_hits.inc("spam")
+        mute_role = role_index.get(view.guild, "muted")
         if mute_role:
             try:
-                await message.author.add_roles(mute_role, reason="Auto-muted for spamming")
-                await message.channel.send(f"🤐 {message.author.mention} muted for spamming.")
+                await view.author.add_roles(mute_role, reason="Auto-muted for spamming")
+                await view.channel.send(f"🤐 {view.author.mention} muted for spamming.")
             except:
                 pass
 
-            embed = discord.Embed(
-                title="🚨 AutoMod: Spam Detected",
-                color=discord.Color.red(),
-                timestamp=datetime.now(timezone.utc)
-            )
-            embed.set_author(name=str(message.author), icon_url=message.author.display_avatar.url)
-            embed.add_field(name="User", value=message.author.mention, inline=False)
-            embed.add_field(name="Action", value="Muted", inline=True)
-            embed.add_field(name="Reason", value="Spamming messages", inline=True)
-            embed.add_field(name="Channel", value=message.channel.mention, inline=False)
-            embed.set_footer(text=f"User ID: {message.author.id}")
-
-            await send_log(message.guild, embed)
-        spam_tracker[message.author.id] = []
-
-    # =========================
-    # Anti-Link (Discord Invites)
-    # =========================
-    if "discord.gg/" in message.content or "discord.com/invite/" in message.content:
-        try:
-            await message.delete()
-        except:
-            pass
+            embed = automod_embed(view, "🚨 AutoMod: Spam Detected", discord.Color.red(), "Muted", "Spamming messages")
+            await send_log(view.guild, embed, log_dispatcher.HIGH)
+    # the message itself stays, keep checking it
+    return False
+
+
+async def load_automod_config():
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute("SELECT guild_id, spam_messages, spam_seconds FROM automod_config") as cur:
+            for guild_id, messages, seconds in await cur.fetchall():
+                spam_tracker.configure(guild_id, messages, seconds)
+        async with db.execute("SELECT guild_id, kind, pattern FROM automod_filters") as cur:
+            for guild_id, kind, pattern in await cur.fetchall():
+                try:
+                    if kind == "word":
+                        content_filter.add_word(guild_id, pattern)
+                    else:
+                        content_filter.add_regex(guild_id, pattern)
+                except ValueError as e:
+                    print(f"skipping filter {pattern!r} for guild {guild_id}:", e)
+
+
+@bot.command(name="antispam")
+@commands.has_permissions(manage_guild=True)
+async def antispam_cmd(ctx, messages: int = None, seconds: float = None):
+    """Show or set the spam threshold. Usage: $antispam 5 5"""
+    if messages is None or seconds is None:
+        limit, window = spam_tracker.limits(ctx.guild.id)
+        return await ctx.send(f"🛡️ Anti-Spam: mute after **{limit}** messages in **{window:g}s**")
+    if not (2 <= messages <= 50) or not (1 <= seconds <= 120):
+        return await ctx.send("❌ messages must be 2-50 and seconds 1-120.")
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.execute("INSERT OR REPLACE INTO automod_config (guild_id, spam_messages, spam_seconds) VALUES (?, ?, ?)",
+                         (ctx.guild.id, messages, seconds))
+        await db.commit()
+    spam_tracker.configure(ctx.guild.id, messages, seconds)
+    await ctx.send(f"✅ Anti-Spam: mute after **{messages}** messages in **{seconds:g}s**")
 
-        embed = discord.Embed(
-            title="🔗 AutoMod: Invite Link Blocked",
-            color=discord.Color.orange(),
-            timestamp=datetime.now(timezone.utc)
-        )
-        embed.set_author(name=str(message.author), icon_url=message.author.display_avatar.url)
-        embed.add_field(name="User", value=message.author.mention, inline=False)
-        embed.add_field(name="Action", value="Message Deleted", inline=True)
-        embed.add_field(name="Reason", value="Posted Invite Link", inline=True)
-        embed.add_field(name="Channel", value=message.channel.mention, inline=False)
-        embed.set_footer(text=f"User ID: {message.author.id}")
-
-        await send_log(message.guild, embed)
-
-    # =========================
-    # Anti-Mass Mentions
-    # =========================
-    if len(message.mentions) >= 5:
+
+# =========================
+# Content filter (invites, banned words, regexes)
+# =========================
+FILTER_REASONS = {
+    "invite": ("🔗 AutoMod: Invite Link Blocked", "Posted Invite Link"),
+    "word": ("🚫 AutoMod: Banned Word", "Used a banned word"),
+    "regex": ("🚫 AutoMod: Filtered Content", "Matched a content filter"),
+}
+
+async def automod_content(view):
+    if view.guild is None:
+        return False
+    hit = content_filter.check(view.guild.id, view.content)
+    if hit is None:
+        return False
+    kind, matched = hit
+    automod_hits.inc(kind)
+    try:
+        await view.message.delete()
+    except:
+        pass
+
+    title, reason = FILTER_REASONS[kind]
+    embed = automod_embed(view, title, discord.Color.orange(), "Message Deleted", reason)
+    embed.add_field(name="Matched", value=f"`{matched[:100]}`", inline=False)
+    await send_log(view.guild, embed, log_dispatcher.HIGH)
+    return True
+
+
+@bot.command(name="filter-add")
+@commands.has_permissions(manage_guild=True)
+async def filter_add(ctx, kind: str, *, pattern: str):
+    """Usage: $filter-add word <word> | $filter-add regex <pattern>"""
+    kind = kind.lower()
+    if kind not in ("word", "regex"):
+        return await ctx.send("❌ Kind must be `word` or `regex`.")
+    try:
+        if kind == "word":
+            content_filter.add_word(ctx.guild.id, pattern)
+        else:
+            content_filter.add_regex(ctx.guild.id, pattern)
+    except ValueError as e:
+        return await ctx.send(f"❌ Invalid pattern: {e}")
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.execute("INSERT OR IGNORE INTO automod_filters (guild_id, kind, pattern) VALUES (?, ?, ?)",
+                         (ctx.guild.id, kind, pattern))
+        await db.commit()
+    await ctx.send(f"✅ Added {kind} filter `{pattern}`")
+
+
+@bot.command(name="filter-remove", help="Remove a filter rule")
+@commands.has_permissions(manage_guild=True)
+async def filter_remove(ctx, kind: str, *, pattern: str):
+    kind = kind.lower()
+    if kind not in ("word", "regex"):
+        return await ctx.send("❌ Kind must be `word` or `regex`.")
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.execute("DELETE FROM automod_filters WHERE guild_id = ? AND kind = ? AND pattern = ?",
+                         (ctx.guild.id, kind, pattern))
+        await db.commit()
+    if kind == "word":
+        content_filter.remove_word(ctx.guild.id, pattern)
+    else:
+        content_filter.remove_regex(ctx.guild.id, pattern)
+    await ctx.send(f"✅ Removed {kind} filter `{pattern}`")
+
+
+@bot.command(name="filter-list", help="Show this server's content filter")
+@commands.has_permissions(manage_guild=True)
+async def filter_list(ctx):
+    rules = content_filter.guild_rules(ctx.guild.id)
+    words = ", ".join(f"`{w}`" for w in sorted(rules.words)) or "None"
+    regexes = "\n".join(f"`{r}`" for r in rules.regexes) or "None"
+    embed = discord.Embed(title="🧹 Content Filters", color=discord.Color.blurple())
+    embed.add_field(name="Invite Links", value="Blocked" if rules.invites else "Allowed", inline=False)
+    embed.add_field(name="Banned Words", value=words[:1024], inline=False)
+    embed.add_field(name="Regexes", value=regexes[:1024], inline=False)
+    await ctx.send(embed=embed)
+
+
+# =========================
+# Anti-Mass Mentions
+# =========================
+async def automod_mass_mentions(view):
+    if view.guild is None:
+        return False
+    if len(view.mentions) >= 5:
+        automod_hits.inc("mass_mentions")
         try:
-            await message.delete()
+            await view.message.delete()
         except:
             pass
 
-        mute_role = discord.utils.get(message.guild.roles, name="Muted")
+        mute_role = role_index.get(view.guild, "muted")
         if mute_role:
             try:
-                await message.author.add_roles(mute_role, reason="Mass mentions")
+                await view.author.add_roles(mute_role, reason="Mass mentions")
             except:
                 pass
 
-        embed = discord.Embed(
-            title="🚨 AutoMod: Mass Mentions",
-            color=discord.Color.dark_red(),
-            timestamp=datetime.now(timezone.utc)
-        )
-        embed.set_author(name=str(message.author), icon_url=message.author.display_avatar.url)
-        embed.add_field(name="User", value=message.author.mention, inline=False)
-        embed.add_field(name="Action", value="Muted", inline=True)
-        embed.add_field(name="Reason", value=f"Tagged {len(message.mentions)} users", inline=True)
-        embed.add_field(name="Channel", value=message.channel.mention, inline=False)
-        embed.set_footer(text=f"User ID: {message.author.id}")
+        embed = automod_embed(view, "🚨 AutoMod: Mass Mentions", discord.Color.dark_red(), "Muted", f"Tagged {len(view.mentions)} users")
+        await send_log(view.guild, embed, log_dispatcher.HIGH)
+        return True
+    return False
 
-        await send_log(message.guild, embed)
 
-    await bot.process_commands(message)
 # ===========================
-# BOT DATABASE SETUP
+# DATABASE SETUP (schema migrations)
 # ===========================
+# every table/index for cases.db and bot.db lives in migrations.py;
+# PRAGMA user_version tracks what has already been applied
+_schema_ready = False
 
-BOT_DB = "bot.db"
-
-async def setup_bot_db():
-    async with aiosqlite.connect(BOT_DB) as db:
-        # Anti-Nuke tables
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS antinuke (
-                guild_id INTEGER PRIMARY KEY,
-                enabled INTEGER DEFAULT 0
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS antinuke_whitelist (
-                guild_id INTEGER,
-                user_id INTEGER,
-                PRIMARY KEY (guild_id, user_id)
-            )
-        """)
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS antinuke_logs (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER
-            )
-        """)
-        # Deleted messages
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS deleted_messages (
-                guild_id INTEGER,
-                channel_id INTEGER,
-                message_id INTEGER PRIMARY KEY,
-                author_id INTEGER,
-                content TEXT,
-                attachments TEXT,
-                timestamp TEXT
-            )
-        """)
-        # Suggestions table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS suggestions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                message_id INTEGER,
-                channel_id INTEGER,
-                suggestion TEXT,
-                status TEXT DEFAULT 'Pending',
-                created_at TIMESTAMP
-            )
-        """)
-        await db.commit()
-    
-# =========================
-# PROFESSIONAL ANTI-NUKE v2
-# DATABASE SETUP (UPDATED)
-# =========================
 async def setup_database():
-    async with aiosqlite.connect("bot.db") as db:
-        # Anti-Nuke main table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS antinuke (
-                guild_id INTEGER PRIMARY KEY,
-                enabled INTEGER DEFAULT 0
-            )
-        """)
-        # Whitelisted users
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS antinuke_whitelist (
-                guild_id INTEGER,
-                user_id INTEGER,
-                PRIMARY KEY (guild_id, user_id)
-            )
-        """)
-        # Logging channel per guild
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS antinuke_logs (
-                guild_id INTEGER PRIMARY KEY,
-                channel_id INTEGER
-            )
-        """)
-        # Deleted messages storage for recovery
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS deleted_messages (
-                guild_id INTEGER,
-                channel_id INTEGER,
-                message_id INTEGER PRIMARY KEY,
-                author_id INTEGER,
-                content TEXT,
-                attachments TEXT,
-                timestamp TEXT
-            )
-        """)
-        # Case tracking for moderation
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS cases (
-                case_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                guild_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                moderator_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                reason TEXT,
-                timestamp TEXT
-            )
-        """)
-        await db.commit()
+    global _schema_ready
+    if _schema_ready:
+        return
+    async with db_pool.acquire(CASE_DB) as db:
+        await migrate(db, CASES_MIGRATIONS)
+    async with db_pool.acquire(BOT_DB) as db:
+        await migrate(db, BOT_MIGRATIONS)
+    _schema_ready = True
+
+# -------------------------
+# CONFIG CACHE (write-through)
+# -------------------------
+ANTINUKE_PUNISHMENTS = ("strip", "ban")
+# destructive actions (role/channel/emoji deletes) per actor, default 3 in 10 sec
+nuke_tracker = SpamTracker(limit=3, window=10.0)
+
+
+class AntiNukeCache:
+    """Per-guild enabled flag, whitelist and log channel held in memory so the
+    nuke event handlers never touch the DB. Commands write DB first, then cache."""
+
+    def __init__(self):
+        self.enabled = {}       # guild_id -> bool
+        self.punishment = {}    # guild_id -> 'strip' | 'ban'
+        self.whitelist = {}     # guild_id -> set(user_id)
+        self.log_channel = {}   # guild_id -> channel_id
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        async with self._lock:
+            if self.loaded:
+                return
+            async with db_pool.acquire(BOT_DB) as db:
+                enabled, punishment = {}, {}
+                async with db.execute("SELECT guild_id, enabled, punishment, max_actions, window_seconds FROM antinuke") as cur:
+                    for gid, flag, punish, max_actions, window in await cur.fetchall():
+                        enabled[gid] = bool(flag)
+                        punishment[gid] = punish
+                        nuke_tracker.configure(gid, max_actions, window)
+                whitelist = defaultdict(set)
+                async with db.execute("SELECT guild_id, user_id FROM antinuke_whitelist") as cur:
+                    for gid, uid in await cur.fetchall():
+                        whitelist[gid].add(uid)
+                async with db.execute("SELECT guild_id, channel_id FROM antinuke_logs") as cur:
+                    log_channel = dict(await cur.fetchall())
+            self.enabled, self.whitelist, self.log_channel = enabled, dict(whitelist), log_channel
+            self.punishment = punishment
+            self.loaded = True
+
+    async def is_enabled(self, guild_id):
+        if not self.loaded:
+            await self.load()
+        return self.enabled.get(guild_id, False)
+
+    async def is_whitelisted(self, guild_id, user_id):
+        if not self.loaded:
+            await self.load()
+        return user_id in self.whitelist.get(guild_id, ())
+
+    async def get_log_channel(self, guild_id):
+        if not self.loaded:
+            await self.load()
+        return self.log_channel.get(guild_id)
+
+    def get_punishment(self, guild_id):
+        return self.punishment.get(guild_id, "strip")
+
+    async def set_enabled(self, guild_id, enabled: bool):
+        async with db_pool.acquire(BOT_DB) as db:
+            await db.execute("""
+                INSERT INTO antinuke (guild_id, enabled) VALUES (?, ?)
+                ON CONFLICT (guild_id) DO UPDATE SET enabled = excluded.enabled
+            """, (guild_id, int(enabled)))
+            await db.commit()
+        self.enabled[guild_id] = enabled
+
+    async def set_punishment(self, guild_id, punishment: str, max_actions: int, window: float):
+        async with db_pool.acquire(BOT_DB) as db:
+            await db.execute("""
+                INSERT INTO antinuke (guild_id, punishment, max_actions, window_seconds) VALUES (?, ?, ?, ?)
+                ON CONFLICT (guild_id) DO UPDATE SET punishment = excluded.punishment,
+                    max_actions = excluded.max_actions, window_seconds = excluded.window_seconds
+            """, (guild_id, punishment, max_actions, window))
+            await db.commit()
+        self.punishment[guild_id] = punishment
+        nuke_tracker.configure(guild_id, max_actions, window)
+
+    async def add_whitelist(self, guild_id, user_id):
+        async with db_pool.acquire(BOT_DB) as db:
+            await db.execute("INSERT OR IGNORE INTO antinuke_whitelist (guild_id, user_id) VALUES (?, ?)", (guild_id, user_id))
+            await db.commit()
+        self.whitelist.setdefault(guild_id, set()).add(user_id)
+
+    async def remove_whitelist(self, guild_id, user_id):
+        async with db_pool.acquire(BOT_DB) as db:
+            await db.execute("DELETE FROM antinuke_whitelist WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+            await db.commit()
+        self.whitelist.get(guild_id, set()).discard(user_id)
+
+    async def set_log_channel(self, guild_id, channel_id):
+        async with db_pool.acquire(BOT_DB) as db:
+            await db.execute("INSERT OR REPLACE INTO antinuke_logs (guild_id, channel_id) VALUES (?, ?)", (guild_id, channel_id))
+            await db.commit()
+        self.log_channel[guild_id] = channel_id
+
+
+antinuke_cache = AntiNukeCache()
 
 # -------------------------
 # ENABLE / DISABLE / STATUS
 # -------------------------
-@bot.command(name="antinuke-enable")
+@bot.command(name="antinuke-enable", help="Enable anti-nuke protection")
+@role_index.require("antinuke")
 async def antinuke_enable(ctx):
-    if ANTINUKE_ROLE_ID not in [r.id for r in ctx.author.roles]:
-        return await ctx.send("❌ You don’t have permission")
-    async with aiosqlite.connect("bot.db") as db:
-        await db.execute("INSERT OR REPLACE INTO antinuke (guild_id, enabled) VALUES (?, ?)", (ctx.guild.id, 1))
-        await db.commit()
+    await antinuke_cache.set_enabled(ctx.guild.id, True)
     await ctx.send("✅ Anti-Nuke enabled")
 
-@bot.command(name="antinuke-disable")
+@bot.command(name="antinuke-disable", help="Disable anti-nuke protection")
+@role_index.require("antinuke")
 async def antinuke_disable(ctx):
-    if ANTINUKE_ROLE_ID not in [r.id for r in ctx.author.roles]:
-        return await ctx.send("❌ You don’t have permission")
-    async with aiosqlite.connect("bot.db") as db:
-        await db.execute("INSERT OR REPLACE INTO antinuke (guild_id, enabled) VALUES (?, ?)", (ctx.guild.id, 0))
-        await db.commit()
+    await antinuke_cache.set_enabled(ctx.guild.id, False)
     await ctx.send("⚠️ Anti-Nuke disabled")
 
-@bot.command(name="antinuke-status")
+@bot.command(name="antinuke-status", help="Show anti-nuke status")
 async def antinuke_status(ctx):
     enabled = await is_enabled(ctx.guild.id)
     status = "🟢 Enabled" if enabled else "🔴 Disabled"
-    await ctx.send(f"📊 Anti-Nuke Status: {status}")
+    max_actions, window = nuke_tracker.limits(ctx.guild.id)
+    log_channel = await antinuke_cache.get_log_channel(ctx.guild.id)
+    await ctx.send(f"📊 Anti-Nuke Status: {status}\n"
+                   f"Punishment: **{antinuke_cache.get_punishment(ctx.guild.id)}** after "
+                   f"{max_actions} deletions in {window:g}s\n"
+                   f"Alerts: {f'<#{log_channel}>' if log_channel else 'not set (`$antinuke-log #channel`)'}")
+
+@bot.command(name="antinuke-punish", help="Set what happens to nukers")
+@role_index.require("antinuke")
+async def antinuke_punish(ctx, punishment: str, actions: int = 3, seconds: float = 10.0):
+    punishment = punishment.lower()
+    if punishment not in ANTINUKE_PUNISHMENTS:
+        return await ctx.send(f"❌ Punishment must be one of: {', '.join(ANTINUKE_PUNISHMENTS)}")
+    if not (2 <= actions <= 50) or not (1 <= seconds <= 300):
+        return await ctx.send("❌ Use 2-50 actions within 1-300 seconds.")
+    await antinuke_cache.set_punishment(ctx.guild.id, punishment, actions, seconds)
+    await ctx.send(f"✅ Anti-Nuke will **{punishment}** anyone making {actions} deletions in {seconds:g}s")
+
+@bot.command(name="antinuke-log", help="Set the channel anti-nuke alerts go to")
+@role_index.require("antinuke")
+async def antinuke_log(ctx, channel: discord.TextChannel):
+    await antinuke_cache.set_log_channel(ctx.guild.id, channel.id)
+    await ctx.send(f"✅ Anti-Nuke alerts will be posted in {channel.mention}")
 
 # -------------------------
 # WHITELIST MANAGEMENT
 # -------------------------
-@bot.command(name="antinuke-whitelist-add")
+@bot.command(name="antinuke-whitelist-add", help="Trust a user")
+@role_index.require("antinuke")
 async def whitelist_add(ctx, user: discord.Member):
-    if ANTINUKE_ROLE_ID not in [r.id for r in ctx.author.roles]:
-        return await ctx.send("❌ No permission")
-    async with aiosqlite.connect("bot.db") as db:
-        await db.execute("INSERT OR IGNORE INTO antinuke_whitelist (guild_id, user_id) VALUES (?, ?)", (ctx.guild.id, user.id))
-        await db.commit()
+    await antinuke_cache.add_whitelist(ctx.guild.id, user.id)
     await ctx.send(f"✅ {user.mention} added to whitelist")
 
-@bot.command(name="antinuke-whitelist-remove")
+@bot.command(name="antinuke-whitelist-remove", help="Stop trusting a user")
+@role_index.require("antinuke")
 async def whitelist_remove(ctx, user: discord.Member):
-    if ANTINUKE_ROLE_ID not in [r.id for r in ctx.author.roles]:
-        return await ctx.send("❌ No permission")
-    async with aiosqlite.connect("bot.db") as db:
-        await db.execute("DELETE FROM antinuke_whitelist WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, user.id))
-        await db.commit()
+    await antinuke_cache.remove_whitelist(ctx.guild.id, user.id)
     await ctx.send(f"✅ {user.mention} removed from whitelist")
 
-@bot.command(name="antinuke-whitelist-list")
+@bot.command(name="antinuke-whitelist-list", help="List trusted users")
 async def whitelist_list(ctx):
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("SELECT user_id FROM antinuke_whitelist WHERE guild_id = ?", (ctx.guild.id,))
-        rows = await cursor.fetchall()
-    if not rows: return await ctx.send("❌ No whitelisted users")
-    mentions = [ctx.guild.get_member(r[0]).mention if ctx.guild.get_member(r[0]) else f"User ID {r[0]}" for r in rows]
+    await antinuke_cache.load()
+    user_ids = sorted(antinuke_cache.whitelist.get(ctx.guild.id, ()))
+    if not user_ids: return await ctx.send("❌ No whitelisted users")
+    mentions = [ctx.guild.get_member(uid).mention if ctx.guild.get_member(uid) else f"User ID {uid}" for uid in user_ids]
     await ctx.send("📋 Whitelisted Users:\n" + "\n".join(mentions))
 
 # -------------------------
-# EVENT LISTENERS (AUTO RESTORE)
+# ACTOR ATTRIBUTION + PUNISHMENT
 # -------------------------
-@bot.event
-async def on_guild_role_delete(role):
-    if not await is_enabled(role.guild.id): return
-    if await is_whitelisted(role.guild.id, role.guild.owner_id): return
-    await role.guild.create_role(name=role.name, permissions=role.permissions, colour=role.color,
-                                 hoist=role.hoist, mentionable=role.mentionable, reason="Anti-Nuke: Role Restore")
-    await log_event(role.guild, f"Role {role.name} deleted and restored")
+# the actor comes from the audit log (lookups are batched per guild/action,
+# see audit_log.py); each destructive action counts towards a per-actor
+# sliding window and crossing it strips the actor's roles or bans them
+audit_resolver = AuditLogResolver()
+# the tracker re-arms after every hit, so remember who was just punished
+# instead of stripping/banning the same actor again for every event in a burst
+PUNISH_COOLDOWN = 60
+recently_punished = {}  # (guild_id, user_id) -> timestamp
+# last untrusted delete per guild; periodic guild snapshots hold off while a nuke may be running
+last_destructive = {}   # guild_id -> timestamp
 
-@bot.event
-async def on_guild_channel_delete(channel):
-    if not await is_enabled(channel.guild.id): return
-    overwrites = channel.overwrites
-    await channel.guild.create_text_channel(name=channel.name, overwrites=overwrites, category=channel.category,
-                                            reason="Anti-Nuke: Channel Restore")
-    await log_event(channel.guild, f"Channel {channel.name} deleted and restored")
 
-@bot.event
-async def on_guild_emojis_update(guild, before, after):
+def describe_actor(actor):
+    return f"{actor} ({actor.id})" if actor else "unknown user"
+
+
+async def punish_actor(guild, actor, reason):
+    now = datetime.now(timezone.utc).timestamp()
+    for key in [k for k, t in recently_punished.items() if now - t > PUNISH_COOLDOWN]:
+        del recently_punished[key]
+    if (guild.id, actor.id) in recently_punished:
+        return
+    recently_punished[(guild.id, actor.id)] = now
+
+    member = guild.get_member(actor.id)
+    punishment = antinuke_cache.get_punishment(guild.id)
+    if member is not None and member.top_role >= guild.me.top_role:
+        await log_event(guild, f"⚠️ Can't punish {describe_actor(actor)}: their top role is above mine")
+        return
+    try:
+        # a bot's integration role can't be stripped, so rogue bots are always banned
+        if punishment == "ban" or member is None or member.bot:
+            await guild.ban(actor, reason=reason)
+            action = "banned"
+        else:
+            # keep a snapshot so a false positive can be undone with $recover
+            await save_snapshots(guild.id, [member], "antinuke", bot.user.id)
+            await member.edit(roles=[r for r in member.roles if r.managed and not r.is_default()], reason=reason)
+            action = "stripped of their roles"
+    except discord.HTTPException as e:
+        await log_event(guild, f"⚠️ Failed to punish {describe_actor(actor)}: {e}")
+        return
+    await log_event(guild, f"🔨 {describe_actor(actor)} {action}: {reason}")
+
+
+async def check_nuke_action(guild, action, target_id):
+    """Resolve who did it and count it. Returns (restore, actor): restore is
+    False when anti-nuke is off or the actor is trusted."""
+    if not await is_enabled(guild.id):
+        return False, None
+    actor = await audit_resolver.actor(guild, action, target_id)
+    now = datetime.now(timezone.utc).timestamp()
+    if actor is None:
+        # can't attribute it (no audit log access / entry never showed up): restore anyway
+        last_destructive[guild.id] = now
+        return True, None
+    if actor.id in (bot.user.id, guild.owner_id) or await is_whitelisted(guild.id, actor.id):
+        return False, actor
+    last_destructive[guild.id] = now
+    if nuke_tracker.hit(guild.id, actor.id, now):
+        max_actions, window = nuke_tracker.limits(guild.id)
+        await punish_actor(guild, actor, f"Anti-Nuke: {max_actions} deletions within {window:g}s")
+    return True, actor
+
+
+# -------------------------
+# EVENT LISTENERS (AUTO RESTORE)
+# -------------------------
+# listeners, not @bot.event, so the logging handlers above keep running too
+@bot.listen("on_guild_role_delete")
+async def antinuke_role_delete(role):
+    restore, actor = await check_nuke_action(role.guild, discord.AuditLogAction.role_delete, role.id)
+    if not restore: return
+    new_role = await role.guild.create_role(name=role.name, permissions=role.permissions, colour=role.color,
+                                            hoist=role.hoist, mentionable=role.mentionable, reason="Anti-Nuke: Role Restore")
+    # new roles land at the bottom; put it back where it was (as far as we can reach)
+    position = min(role.position, role.guild.me.top_role.position - 1)
+    if position > 1:
+        try:
+            await new_role.edit(position=position, reason="Anti-Nuke: Role Restore")
+        except discord.HTTPException:
+            pass
+    await log_event(role.guild, f"Role {role.name} deleted by {describe_actor(actor)} and restored")
+
+@bot.listen("on_guild_channel_delete")
+async def antinuke_channel_delete(channel):
+    restore, actor = await check_nuke_action(channel.guild, discord.AuditLogAction.channel_delete, channel.id)
+    if not restore: return
+    # same type, position, overwrites and settings (categories/voice used to come back as text)
+    await guild_snapshot.create_channel(channel.guild, guild_snapshot.serialize_channel(channel),
+                                        category=channel.category, overwrites=channel.overwrites,
+                                        reason="Anti-Nuke: Channel Restore")
+    await log_event(channel.guild, f"Channel {channel.name} deleted by {describe_actor(actor)} and restored")
+
+@bot.listen("on_guild_emojis_update")
+async def antinuke_emojis_update(guild, before, after):
     if not await is_enabled(guild.id): return
-    before_names = [e.name for e in before]
-    after_names = [e.name for e in after]
-    deleted = [e for e in before if e.name not in after_names]
-    for e in deleted:
-        await guild.create_custom_emoji(name=e.name, image=await e.url.read(), reason="Anti-Nuke: Emoji Restore")
-        await log_event(guild, f"Emoji {e.name} deleted and restored")
+    after_ids = {e.id for e in after}
+    deleted = [e for e in before if e.id not in after_ids]
+
+    # attribution concurrently so all of them share one audit log fetch
+    checks = await asyncio.gather(*(check_nuke_action(guild, discord.AuditLogAction.emoji_delete, e.id) for e in deleted))
+    to_restore = [(e, actor) for e, (restore, actor) in zip(deleted, checks, strict=True) if restore]
+
+    async def restore_emoji(item):
+        e, actor = item
+        image = await emoji_image(e.id, e.animated)
+        await guild.create_custom_emoji(name=e.name, image=image, reason="Anti-Nuke: Emoji Restore")
+        await log_event(guild, f"Emoji {e.name} deleted by {describe_actor(actor)} and restored")
+
+    fanout = FanOut()
+    results = await fanout.run("emojis", restore_emoji, to_restore, guild_snapshot.EMOJI_CONCURRENCY)
+    for (e, _), result in zip(to_restore, results, strict=True):
+        if isinstance(result, Exception):
+            await log_event(guild, f"⚠️ Couldn't restore emoji {e.name}: {result}")
 
 # -------------------------
 # HELPER FUNCTIONS
 # -------------------------
 async def log_event(guild, message):
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("SELECT channel_id FROM antinuke_logs WHERE guild_id = ?", (guild.id,))
-        row = await cursor.fetchone()
-    if row:
-        ch = guild.get_channel(row[0])
+    channel_id = await antinuke_cache.get_log_channel(guild.id)
+    if channel_id:
+        ch = guild.get_channel(channel_id)
         if ch: await ch.send(f"🛡️ {message}")
 
 async def is_enabled(guild_id):
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("SELECT enabled FROM antinuke WHERE guild_id = ?", (guild_id,))
-        row = await cursor.fetchone()
-    return bool(row[0]) if row else False
+    return await antinuke_cache.is_enabled(guild_id)
 
 async def is_whitelisted(guild_id, user_id):
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("SELECT 1 FROM antinuke_whitelist WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
-        row = await cursor.fetchone()
-    return bool(row)
+    return await antinuke_cache.is_whitelisted(guild_id, user_id)
+
+# =========================
+# GUILD SNAPSHOTS (anti-nuke recovery)
+# =========================
+# channels/roles/overwrites/positions/emojis of every anti-nuke guild are
+# snapshotted periodically; only objects that changed are written (see
+# guild_snapshot.py). $guild-restore rebuilds whatever is missing.
+GUILD_SNAPSHOT_INTERVAL = 1800   # seconds between periodic snapshots
+GUILD_SNAPSHOT_QUIET = 600       # skip guilds with untrusted deletes this recent
+GUILD_SNAPSHOTS_KEPT = 48
+guild_snapshot_task = None
+
+
+async def take_guild_snapshot(guild):
+    """(snapshot_id or None if nothing changed, changed object count)"""
+    objects = guild_snapshot.capture(guild)
+    async with db_pool.acquire(BOT_DB) as db:
+        return await guild_snapshot.save_snapshot(db, guild.id, objects, datetime.now(timezone.utc).isoformat(),
+                                                   keep=GUILD_SNAPSHOTS_KEPT)
+
+
+async def guild_snapshot_loop():
+    # snapshot right away, then every interval: a fresh deploy shouldn't go
+    # half an hour with nothing (or something stale) to restore from.
+    # Unchanged objects aren't rewritten, so a restart costs little.
+    while True:
+        now = datetime.now(timezone.utc).timestamp()
+        for guild in bot.guilds:
+            # a snapshot taken mid-nuke would bake the damage in
+            if not await is_enabled(guild.id) or now - last_destructive.get(guild.id, 0) < GUILD_SNAPSHOT_QUIET:
+                continue
+            try:
+                await take_guild_snapshot(guild)
+            except Exception as e:
+                print(f"guild snapshot failed for {guild.id}: {e}")
+        await asyncio.sleep(GUILD_SNAPSHOT_INTERVAL)
+
+
+async def fetch_emoji_image(emoji_id, record):
+    return await emoji_image(emoji_id, record.get("animated", False))
+
+
+# -------------------------
+# EMOJI IMAGE CACHE
+# -------------------------
+# images of every emoji are kept on disk (content-addressed, see
+# emoji_cache.py) so restores don't depend on the CDN still serving them
+emoji_cache = EmojiCache()
+
+
+async def emoji_image(emoji_id, animated):
+    data = await emoji_cache.read(emoji_id)
+    if data is None:
+        ext = "gif" if animated else "png"
+        data = await bot.http.get_from_cdn(f"https://cdn.discordapp.com/emojis/{emoji_id}.{ext}")
+    return data
+
+
+async def refresh_emoji_caches():
+    for guild in bot.guilds:
+        try:
+            await emoji_cache.refresh(guild)
+        except Exception as e:
+            print(f"emoji cache refresh failed for {guild.id}: {e}")
+
+
+@bot.listen("on_guild_emojis_update")
+async def emoji_cache_update(guild, before, after):
+    # deleted emojis are only marked, so the anti-nuke restore can still read them
+    await emoji_cache.refresh(guild)
+
+
+@bot.command(name="guild-snapshot", help="Snapshot channels/roles/emojis now")
+@role_index.require("antinuke")
+async def guild_snapshot_cmd(ctx):
+    snapshot_id, changed = await take_guild_snapshot(ctx.guild)
+    if snapshot_id is None:
+        return await ctx.send("✅ Nothing changed since the last snapshot.")
+    await ctx.send(f"📸 Snapshot **#{snapshot_id}** saved ({changed} changed objects).")
+
+
+@bot.command(name="guild-snapshots", help="List guild snapshots")
+@role_index.require("antinuke")
+async def guild_snapshots_cmd(ctx):
+    async with db_pool.acquire(BOT_DB) as db:
+        rows = await guild_snapshot.list_snapshots(db, ctx.guild.id, limit=10)
+    if not rows:
+        return await ctx.send("❌ No guild snapshots yet. Take one with `$guild-snapshot`.")
+    lines = [f"`#{sid}` {taken_at[:16].replace('T', ' ')} UTC, {changed} changed" for sid, taken_at, changed in rows]
+    await ctx.send("📸 Guild snapshots (newest first):\n" + "\n".join(lines))
+
+
+@bot.command(name="guild-restore", help="Rebuild the guild from a snapshot")
+@role_index.require("antinuke")
+async def guild_restore_cmd(ctx, snapshot_id: int = None):
+    async with db_pool.acquire(BOT_DB) as db:
+        if snapshot_id is None:
+            rows = await guild_snapshot.list_snapshots(db, ctx.guild.id, limit=1)
+            if not rows:
+                return await ctx.send("❌ No guild snapshots yet.")
+            snapshot_id = rows[0][0]
+        state = await guild_snapshot.load_snapshot(db, ctx.guild.id, snapshot_id)
+    if not state:
+        return await ctx.send(f"❌ Snapshot #{snapshot_id} not found.")
+
+    progress = await ctx.send(f"♻️ Restoring guild from snapshot #{snapshot_id}...")
+
+    async def report(stats):
+        try:
+            await progress.edit(content=f"♻️ Restoring #{snapshot_id}: {stats.name} {stats.done}/{stats.total}")
+        except Exception:
+            pass
+
+    restore = guild_snapshot.GuildRestore(ctx.guild, state, http=bot.http, fetch_emoji=fetch_emoji_image,
+                                          reason=f"Guild restore #{snapshot_id} by {ctx.author}", on_progress=report)
+    summary = await restore.run()
+    await progress.edit(content=f"✅ Restored from snapshot #{snapshot_id}\n```\n{summary}\n```")
+    await log_command(ctx, f"Guild restore from snapshot #{snapshot_id}\n```\n{summary}\n```", discord.Color.green())
     
 # =========================
 # STAFF / FUN commands (trial, permdemote, rape/recover)
 # =========================
-@bot.command(name='trial')
+@bot.command(name='trial', help="Add trial staff roles")
 @commands.has_permissions(manage_roles=True)
 async def trial(ctx, member: discord.Member):
     role1 = ctx.guild.get_role(staff_role1_id)
@@ -700,7 +1428,7 @@ async def trial(ctx, member: discord.Member):
     else:
         await ctx.send("⚠️ Required trial roles not found.")
 
-@bot.command(name='cmd_permdemote')
+@bot.command(name='cmd_permdemote', help="Permanent demotion")
 @commands.has_permissions(manage_roles=True)
 async def cmd_permdemote(ctx, member: discord.Member):
     role_ids_to_remove = [
@@ -715,7 +1443,7 @@ async def cmd_permdemote(ctx, member: discord.Member):
         1418641632236011664,
         1418641632236011665
     ]
-    roles_to_remove = [ctx.guild.get_role(rid) for rid in role_ids_to_remove if ctx.guild.get_role(rid) in member.roles]
+    roles_to_remove = [role for rid in role_ids_to_remove if (role := member.get_role(rid)) is not None]
     if roles_to_remove:
         try:
             await member.remove_roles(*roles_to_remove)
@@ -727,32 +1455,175 @@ async def cmd_permdemote(ctx, member: discord.Member):
     else:
         await ctx.send(f"{member.mention} has none of the target roles.")
 
-@bot.command()
+# =========================
+# ROLE SNAPSHOTS (rape/recover + bulk incident recovery)
+# =========================
+SNAPSHOTS_KEPT_PER_USER = 25
+
+
+def snapshot_roles(member):
+    """Role IDs a restore could give back (no @everyone, no integration roles)."""
+    return [r.id for r in member.roles if not r.is_default() and not r.managed]
+
+
+def restorable_roles(guild, role_ids):
+    me = guild.me
+    roles = (guild.get_role(rid) for rid in role_ids)
+    return [r for r in roles if r is not None and not r.managed and r < me.top_role]
+
+
+async def save_snapshots(guild_id, members, label, taken_by):
+    """One transaction for any number of members; returns how many were saved."""
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [(guild_id, m.id, ",".join(map(str, ids)), label, taken_by, now)
+            for m in members if (ids := snapshot_roles(m))]
+    if not rows:
+        return 0
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.executemany(
+            "INSERT INTO role_snapshots (guild_id, user_id, role_ids, label, taken_by, taken_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        # keep a bounded history per member
+        await db.executemany("""
+            DELETE FROM role_snapshots WHERE guild_id = ? AND user_id = ? AND id NOT IN (
+                SELECT id FROM role_snapshots WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?
+            )
+        """, [(guild_id, r[1], guild_id, r[1], SNAPSHOTS_KEPT_PER_USER) for r in rows])
+        await db.commit()
+    return len(rows)
+
+
+async def get_snapshot(guild_id, user_id, snapshot_id=None):
+    sql = "SELECT id, role_ids, label, taken_at FROM role_snapshots WHERE guild_id = ? AND user_id = ?"
+    params = [guild_id, user_id]
+    if snapshot_id is not None:
+        sql += " AND id = ?"
+        params.append(snapshot_id)
+    sql += " ORDER BY id DESC LIMIT 1"
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute(sql, params) as cur:
+            return await cur.fetchone()
+
+
+async def restore_member(member, role_ids, reason):
+    """Put the snapshot roles back with a single member.edit call."""
+    keep = [r for r in member.roles if not r.is_default()]
+    wanted = {r.id: r for r in keep}
+    for role in restorable_roles(member.guild, role_ids):
+        wanted.setdefault(role.id, role)
+    if len(wanted) == len(keep):
+        return 0
+    await member.edit(roles=list(wanted.values()), reason=reason)
+    return len(wanted) - len(keep)
+
+
+@bot.command(help="Remove all roles")
 @commands.has_permissions(manage_roles=True)
 async def rape(ctx, user: discord.Member):
-    roles = user.roles[1:]
-    if not roles:
+    if not snapshot_roles(user):
         await ctx.send(f"{user.mention} has no roles to remove!")
         return
-    removed_roles[user.id] = roles
+    await save_snapshots(ctx.guild.id, [user], "rape", ctx.author.id)
     try:
-        await user.remove_roles(*roles)
+        # managed roles can't be removed, everything else goes in one edit
+        await user.edit(roles=[r for r in user.roles if r.managed and not r.is_default()],
+                        reason=f"Roles stripped by {ctx.author}")
     except Exception:
         pass
     await ctx.send(f"❌ Removed all roles from {user.mention} (stored for recovery).")
 
-@bot.command()
+@bot.command(help="Restore removed roles")
 @commands.has_permissions(manage_roles=True)
-async def recover(ctx, user: discord.Member):
-    if user.id not in removed_roles:
+async def recover(ctx, user: discord.Member, snapshot_id: int = None):
+    snapshot = await get_snapshot(ctx.guild.id, user.id, snapshot_id)
+    if not snapshot:
         await ctx.send(f"{user.mention} has no roles stored for recovery!")
         return
+    sid, role_ids, label, taken_at = snapshot
     try:
-        await user.add_roles(*removed_roles[user.id])
+        await restore_member(user, [int(x) for x in role_ids.split(",") if x], f"Roles recovered by {ctx.author}")
     except Exception:
         pass
-    removed_roles.pop(user.id, None)
-    await ctx.send(f"✅ Recovered all roles for {user.mention}.")
+    await ctx.send(f"✅ Recovered all roles for {user.mention} (snapshot #{sid}).")
+
+
+@bot.command(name="snapshots", help="List a member's role snapshots")
+@commands.has_permissions(manage_roles=True)
+async def snapshots_cmd(ctx, user: discord.Member):
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute(
+            "SELECT id, role_ids, label, taken_at FROM role_snapshots WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT 10",
+            (ctx.guild.id, user.id)
+        ) as cur:
+            rows = await cur.fetchall()
+    if not rows:
+        return await ctx.send(f"{user.mention} has no role snapshots.")
+    embed = discord.Embed(title=f"🗂️ Role snapshots for {user}", color=discord.Color.blurple())
+    for sid, role_ids, label, taken_at in rows:
+        mentions = " ".join(f"<@&{rid}>" for rid in role_ids.split(",") if rid)
+        embed.add_field(name=f"#{sid} — {label} — {taken_at[:19].replace('T', ' ')} UTC",
+                        value=mentions[:1024] or "None", inline=False)
+    embed.set_footer(text="Restore one with $recover @user <id>")
+    await ctx.send(embed=embed)
+
+
+@bot.command(name="snapshot-bulk")
+@commands.has_permissions(administrator=True)
+async def snapshot_bulk(ctx, role: discord.Role = None):
+    """Snapshot roles for every member (or every member of a role) in one go."""
+    members = [m for m in (role.members if role else ctx.guild.members) if not m.bot]
+    label = f"bulk-{int(datetime.now(timezone.utc).timestamp())}"
+    saved = await save_snapshots(ctx.guild.id, members, label, ctx.author.id)
+    await ctx.send(f"📸 Saved role snapshots for **{saved}** members as `{label}`.")
+    await log_command(ctx, f"Bulk role snapshot `{label}` ({saved} members)", discord.Color.blurple())
+
+
+@bot.command(name="restore-bulk")
+@commands.has_permissions(administrator=True)
+async def restore_bulk(ctx, label: str = None):
+    """Restore every member from a bulk snapshot (latest one by default)."""
+    async with db_pool.acquire(BOT_DB) as db:
+        if label is None:
+            async with db.execute(
+                "SELECT label FROM role_snapshots WHERE guild_id = ? AND label LIKE 'bulk-%' ORDER BY id DESC LIMIT 1",
+                (ctx.guild.id,)
+            ) as cur:
+                row = await cur.fetchone()
+            if not row:
+                return await ctx.send("❌ No bulk snapshot found. Take one with `$snapshot-bulk`.")
+            label = row[0]
+        async with db.execute(
+            "SELECT user_id, role_ids FROM role_snapshots WHERE guild_id = ? AND label = ?",
+            (ctx.guild.id, label)
+        ) as cur:
+            rows = await cur.fetchall()
+    if not rows:
+        return await ctx.send(f"❌ Snapshot `{label}` not found.")
+
+    progress = await ctx.send(f"♻️ Restoring roles for {len(rows)} members from `{label}`...")
+
+    async def report(stats):
+        try:
+            await progress.edit(content=f"♻️ Restoring `{label}`: {stats.done}/{stats.total}")
+        except Exception:
+            pass
+
+    async def restore_one(row):
+        user_id, role_ids = row
+        member = ctx.guild.get_member(user_id)
+        if member is None:
+            return 0
+        return await restore_member(member, [int(x) for x in role_ids.split(",") if x],
+                                    f"Bulk restore `{label}` by {ctx.author}")
+
+    fanout = FanOut(on_progress=report)
+    results = await fanout.run("restore", restore_one, rows, 5)
+    restored = sum(1 for r in results if isinstance(r, int) and r > 0)
+    failed = fanout.phases[0].failed
+    await progress.edit(content=f"✅ Restored roles for **{restored}** members from `{label}`"
+                                + (f" ({failed} failed)." if failed else "."))
+    await log_command(ctx, f"Bulk role restore `{label}`: {restored} restored, {failed} failed", discord.Color.green())
 
 
 # Required imports (add if you don't already have them)
@@ -766,6 +1637,11 @@ MAX_REPEATS = 100       # <-- safe default. Change to 100 ONLY if you understand
 MAX_CHANNELS = 500       # max number of temp channels to create in one run
 GUILD_COOLDOWN_SECONDS = 600  # cooldown per guild to avoid repeated runs
 VISIBLE_SECONDS = 15    # how long each temp channel stays visible before deletion
+# in-flight requests per phase; channel create/delete share one per-guild bucket,
+# sends go to a different channel (bucket) each
+MASSPING_CREATE_CONCURRENCY = 5
+MASSPING_SEND_CONCURRENCY = 10
+MASSPING_DELETE_CONCURRENCY = 5
 # ---------------------------------------------------
 
 from discord.ext.commands import BucketType, cooldown
@@ -865,35 +1741,40 @@ async def massping(ctx, target: str = "everyone", repeats: int = 1, *, reason: s
         # if target is a string that isn't role/everyone, treat as plain text announcement
         pass
 
-    # Create temp channels, send announcement, then delete after VISIBLE_SECONDS
-    created = []
-    for i in range(1, to_create + 1):
-        chan_name = f"temp-announcement-{i}"
-        try:
-            temp_chan = await ctx.guild.create_text_channel(
-                name=chan_name,
-                reason=f"Massping test requested by {ctx.author}"
-            )
-            created.append(temp_chan)
-        except Exception as e:
-            await ctx.send(f"⚠️ Failed to create channel `{chan_name}`: {e}")
-            # continue to next (we won't abort entirely)
+    if mention_role:
+        content = mention_role.mention
+    elif will_mention_everyone:
+        content = "@everyone"
+    else:
+        content = None
+
+    # Create temp channels, send announcement, then delete after VISIBLE_SECONDS.
+    # Each phase fans out under a semaphore sized for its route bucket.
+    progress_msg = await ctx.send(f"⏳ Starting massping test ({to_create} channels)...")
 
-    # Send messages
-    for idx, ch in enumerate(created, start=1):
+    async def report(stats):
         try:
-            if mention_role:
-                content = mention_role.mention
-            elif will_mention_everyone:
-                content = "@everyone"
-            else:
-                content = None
+            await progress_msg.edit(content=f"⏳ {stats.name}: {stats.done}/{stats.total}")
+        except Exception:
+            pass
 
-            # Include embed for dramatic effect
-            await ch.send(content=content, embed=embed, allowed_mentions=allowed)
-        except Exception as e:
-            # ignore send errors but notify
-            await ctx.send(f"⚠️ Failed to send in {ch.mention}: {e}", delete_after=6)
+    fanout = FanOut(on_progress=report)
+
+    async def create(i):
+        return await ctx.guild.create_text_channel(
+            name=f"temp-announcement-{i}",
+            reason=f"Massping test requested by {ctx.author}"
+        )
+
+    results = await fanout.run("create", create, range(1, to_create + 1), MASSPING_CREATE_CONCURRENCY)
+    created = [ch for ch in results if isinstance(ch, discord.abc.GuildChannel)]
+
+    # Send messages (different channels = different buckets, so this can go wider)
+    async def announce(ch):
+        # Include embed for dramatic effect
+        await ch.send(content=content, embed=embed, allowed_mentions=allowed)
+
+    await fanout.run("send", announce, created, MASSPING_SEND_CONCURRENCY)
 
     # Optional logging channel hook (if you have send_log)
     try:
@@ -905,19 +1786,22 @@ async def massping(ctx, target: str = "everyone", repeats: int = 1, *, reason: s
     # Wait visible_seconds then delete created channels
     await asyncio.sleep(VISIBLE_SECONDS)
 
-    for ch in created:
+    async def cleanup(ch):
         try:
             await ch.delete(reason=f"Cleanup after massping test by {ctx.author}")
-        except Exception as e:
+        except Exception:
             # if delete fails, try to delete the message(s) inside instead
             try:
                 async for msg in ch.history(limit=50):
                     try: await msg.delete()
                     except: pass
             except: pass
+            raise
+
+    await fanout.run("delete", cleanup, created, MASSPING_DELETE_CONCURRENCY)
 
     try:
-        await ctx.send("✅ Test complete — temporary channels removed.", delete_after=6)
+        await progress_msg.edit(content="✅ Test complete — temporary channels removed.\n```\n" + fanout.summary() + "\n```")
     except:
         pass
         
@@ -928,7 +1812,7 @@ async def massping(ctx, target: str = "everyone", repeats: int = 1, *, reason: s
 # =========================
 # Warn Command
 # =========================
-@bot.command(name='warn')
+@bot.command(name='warn', help="Warn a user")
 @commands.has_permissions(manage_roles=True)
 async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided"):
     try:
@@ -941,46 +1825,132 @@ async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided
     counts = await get_case_counts(ctx.guild.id, member.id)
     embed = discord.Embed(color=discord.Color.gold(), timestamp=datetime.now(timezone.utc))
     embed.description = f"✅ `Case #{case_id}` {member.mention} has been **warned**.\n\n**Reason:** *{reason}*"
+    embed.set_footer(text=f"Warned: {counts['Warn']} | Muted: {counts['Mute']} | Kicked: {counts['Kick']} | Banned: {counts['Ban']}")
     await ctx.send(embed=embed)
     await log_command(ctx, f"Warned {member} | Case #{case_id} | Reason: {reason}", discord.Color.orange())
 
+# =========================
+# Warnings List Command
+# =========================
+CASES_PER_PAGE = 10
+
+
+def parse_case_filters(filters):
+    """`warn`/`mute`/`kick`/`ban`, `since:YYYY-MM-DD`, `until:YYYY-MM-DD` -> (action, since, until)"""
+    action = since = until = None
+    actions = {a.lower(): a for a in CASE_ACTIONS}
+    for token in filters:
+        key, _, value = token.partition(":")
+        if token.lower() in actions:
+            action = actions[token.lower()]
+        elif key.lower() in ("since", "until") and value:
+            day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            if key.lower() == "since":
+                since = day.isoformat()
+            else:
+                # inclusive of the whole "until" day
+                until = (day + timedelta(days=1)).isoformat()
+        else:
+            raise ValueError(token)
+    return action, since, until
+
+
+class CaseHistoryView(View):
+    """Prev/Next buttons over a member's cases; fetches one page per click."""
+
+    def __init__(self, author, guild, member, counts, action=None, since=None, until=None):
+        super().__init__(timeout=120)
+        self.author = author
+        self.guild = guild
+        self.member = member
+        self.counts = counts
+        self.filters = {"action": action, "since": since, "until": until}
+        self.page = 1
+        self.rows = []
+        self.has_prev = False
+        self.has_next = False
+
+    async def load(self, *, after=None, before=None):
+        # ask for one extra row to learn whether another page exists
+        rows = await get_user_cases(self.guild.id, self.member.id, after=after, before=before,
+                                    limit=CASES_PER_PAGE + 1, **self.filters)
+        if before is not None:
+            self.has_prev = len(rows) > CASES_PER_PAGE
+            self.rows = rows[-CASES_PER_PAGE:]
+            self.has_next = True
+        else:
+            self.has_next = len(rows) > CASES_PER_PAGE
+            self.rows = rows[:CASES_PER_PAGE]
+            self.has_prev = after is not None
+        self.prev_button.disabled = not self.has_prev
+        self.next_button.disabled = not self.has_next
+
+    def build_embed(self):
+        embed = discord.Embed(title=f"📋 Cases for {self.member}", color=discord.Color.orange(), timestamp=datetime.now(timezone.utc))
+        for cid, mod_id, action, reason, ts in self.rows:
+            moderator = self.guild.get_member(mod_id)
+            mod_name = str(moderator) if moderator else f"<@{mod_id}>"
+            try:
+                ts_display = datetime.fromisoformat(ts).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+            except Exception:
+                ts_display = str(ts)
+            embed.add_field(
+                name=f"Case #{cid} — {action}",
+                value=f"**Moderator:** {mod_name}\n**Reason:** {reason}\n**At:** {ts_display}",
+                inline=False
+            )
+        counts = self.counts
+        embed.set_footer(text=f"Page {self.page} | Warned: {counts['Warn']} | Muted: {counts['Mute']} | Kicked: {counts['Kick']} | Banned: {counts['Ban']}")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.author.id
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, _button: Button):
+        await self.load(before=self.rows[0][0])
+        self.page -= 1
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, _button: Button):
+        await self.load(after=self.rows[-1][0])
+        self.page += 1
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+
 # =========================
 # Warnings List Command
 # =========================
 @bot.command(name='warnings')
 @commands.has_permissions(manage_roles=True)
-async def warnings_cmd(ctx, member: discord.Member = None):
+async def warnings_cmd(ctx, member: typing.Optional[discord.Member] = None, *filters: str):
+    """Usage: $warnings [@user] [warn|mute|kick|ban] [since:YYYY-MM-DD] [until:YYYY-MM-DD]"""
     member = member or ctx.author
     try:
-        cases = await get_user_cases(ctx.guild.id, member.id)
+        action, since, until = parse_case_filters(filters)
+    except ValueError as e:
+        return await ctx.send(f"⚠️ Unknown filter `{e}`. Use warn/mute/kick/ban, since:YYYY-MM-DD, until:YYYY-MM-DD")
+
+    try:
+        counts = await get_case_counts(ctx.guild.id, member.id)
+        view = CaseHistoryView(ctx.author, ctx.guild, member, counts, action, since, until)
+        await view.load()
     except Exception as e:
         await ctx.send("⚠️ Unable to read cases from database.")
         print("get_user_cases error:", e)
         return
 
-    if not cases:
-        return await ctx.send(f"✅ {member.mention} has no cases.")
-    counts = await get_case_counts(ctx.guild.id, member.id)
-    embed = discord.Embed(title=f"📋 Cases for {member}", color=discord.Color.orange(), timestamp=datetime.now(timezone.utc))
-    for cid, mod_id, action, reason, ts in cases:
-        moderator = ctx.guild.get_member(mod_id)
-        mod_name = str(moderator) if moderator else f"<@{mod_id}>"
-        try:
-            ts_display = datetime.fromisoformat(ts).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-        except Exception:
-            ts_display = str(ts)
-        embed.add_field(
-            name=f"Case #{cid} — {action}",
-            value=f"**Moderator:** {mod_name}\n**Reason:** {reason}\n**At:** {ts_display}",
-            inline=False
-        )
-    embed.set_footer(text=f"Warned: {counts['Warn']} | Muted: {counts['Mute']} | Kicked: {counts['Kick']} | Banned: {counts['Ban']}")
-    await ctx.send(embed=embed)
+    if not view.rows:
+        return await ctx.send(f"✅ {member.mention} has no {'matching ' if filters else ''}cases.")
+    if not view.has_next:
+        return await ctx.send(embed=view.build_embed())
+    await ctx.send(embed=view.build_embed(), view=view)
 
 # =========================
 # Unwarn Command
 # =========================
-@bot.command(name='unwarn')
+@bot.command(name='unwarn', help="Remove a warning")
 @commands.has_permissions(manage_roles=True)
 async def unwarn_cmd(ctx, case_id: int):
     try:
@@ -1027,10 +1997,10 @@ async def unwarn_cmd(ctx, case_id: int):
 # =========================
 # Mute Command
 # =========================
-@bot.command(name='mute')
+@bot.command(name='mute', help="Mute a user")
 @commands.has_permissions(manage_roles=True)
 async def mute_cmd(ctx, member: discord.Member, *, reason: str = "No reason provided"):
-    mute_role = discord.utils.get(ctx.guild.roles, name="Muted")
+    mute_role = role_index.get(ctx.guild, "muted")
     if not mute_role:
         return await ctx.send("⚠️ No 'Muted' role found on this server.")
     try:
@@ -1052,7 +2022,7 @@ async def mute_cmd(ctx, member: discord.Member, *, reason: str = "No reason prov
 # =========================
 # Kick Command
 # =========================
-@bot.command(name='kick')
+@bot.command(name='kick', help="Kick a user")
 @commands.has_permissions(kick_members=True)
 async def kick_cmd(ctx, member: discord.Member, *, reason: str = "No reason provided"):
     try:
@@ -1070,7 +2040,7 @@ async def kick_cmd(ctx, member: discord.Member, *, reason: str = "No reason prov
 # =========================
 # Ban Command
 # =========================
-@bot.command(name='ban')
+@bot.command(name='ban', help="Ban a user")
 @commands.has_permissions(ban_members=True)
 async def ban_cmd(ctx, member: discord.Member, *, reason: str = "No reason provided"):
     try:
@@ -1086,39 +2056,39 @@ async def ban_cmd(ctx, member: discord.Member, *, reason: str = "No reason provi
     await log_command(ctx, f"Banned {member} | Case #{case_id} | Reason: {reason}", discord.Color.red())# =========================
 # Utility commands
 # =========================
-@bot.command(name="clear")
+@bot.command(name="clear", help="Delete messages")
 @commands.has_permissions(manage_messages=True)
 async def clear_cmd(ctx, amount: int):
     await ctx.channel.purge(limit=amount + 1)
     await ctx.send(f"🧹 Cleared {amount} messages.", delete_after=5)
     await log_command(ctx, f"Cleared {amount} messages in {ctx.channel.mention}", discord.Color.purple())
 
-@bot.command(name="purge")
+@bot.command(name="purge", help="Delete messages")
 @commands.has_permissions(manage_messages=True)
 async def purge_cmd(ctx, amount: int):
     await ctx.channel.purge(limit=amount + 1)
     await ctx.send(f"🧽 Purged {amount} messages.", delete_after=5)
     await log_command(ctx, f"Purged {amount} messages in {ctx.channel.mention}", discord.Color.purple())
 
-@bot.command()
+@bot.command(help="Lock a channel")
 @commands.has_permissions(manage_channels=True)
 async def lock(ctx):
     await ctx.channel.set_permissions(ctx.guild.default_role, send_messages=False)
     await ctx.send("🔒 Channel locked.")
 
-@bot.command()
+@bot.command(help="Unlock a channel")
 @commands.has_permissions(manage_channels=True)
 async def unlock(ctx):
     await ctx.channel.set_permissions(ctx.guild.default_role, send_messages=True)
     await ctx.send("🔓 Channel unlocked.")
 
-@bot.command()
+@bot.command(help="Add role")
 @commands.has_permissions(manage_roles=True)
 async def addrole(ctx, member: discord.Member, role: discord.Role):
     await member.add_roles(role)
     await ctx.send(f"✅ Added <@&{role.id}> to {member.mention}.")
 
-@bot.command()
+@bot.command(help="Remove role")
 @commands.has_permissions(manage_roles=True)
 async def removerole(ctx, member: discord.Member, role: discord.Role):
     await member.remove_roles(role)
@@ -1127,7 +2097,7 @@ async def removerole(ctx, member: discord.Member, role: discord.Role):
 # =========================
 # Info commands
 # =========================
-@bot.command()
+@bot.command(help="View info about a user")
 async def userinfo(ctx, member: discord.Member = None):
     member = member or ctx.author
     roles = " ".join([f"<@&{r.id}>" for r in member.roles if r != ctx.guild.default_role]) or "None"
@@ -1139,7 +2109,7 @@ async def userinfo(ctx, member: discord.Member = None):
     embed.add_field(name="Roles", value=roles, inline=False)
     await ctx.send(embed=embed)
 
-@bot.command()
+@bot.command(help="View server info")
 async def serverinfo(ctx):
     guild = ctx.guild
     embed = discord.Embed(title=f"🌍 Server Info - {guild.name}", color=discord.Color.green())
@@ -1153,56 +2123,205 @@ async def serverinfo(ctx):
 # =========================
 # Productivity                                                                
 # =========================
+# (guild_id, user_id) -> (reason, since); mirrors the afk table, loaded at on_ready
 afk_users = {}
+# (channel_id, user_id) -> last time that AFK notice was shown in the channel
+afk_notice_times = {}
+AFK_NOTICE_COOLDOWN = 60
+_afk_loaded = False
+
+
+async def load_afk():
+    global _afk_loaded
+    if _afk_loaded:
+        return
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute("SELECT guild_id, user_id, reason, since FROM afk") as cur:
+            afk_users.update({(gid, uid): (reason, since) for gid, uid, reason, since in await cur.fetchall()})
+    _afk_loaded = True
+
+
+async def set_afk(guild_id, user_id, reason):
+    since = datetime.now(timezone.utc).timestamp()
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.execute("INSERT OR REPLACE INTO afk (guild_id, user_id, reason, since) VALUES (?, ?, ?, ?)",
+                         (guild_id, user_id, reason, since))
+        await db.commit()
+    afk_users[(guild_id, user_id)] = (reason, since)
+
+
+async def clear_afk(guild_id, user_id):
+    afk_users.pop((guild_id, user_id), None)
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.execute("DELETE FROM afk WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        await db.commit()
+
 
 @bot.command()
+@commands.guild_only()
 async def afk(ctx, *, reason: str = "AFK"):
     """Set yourself as AFK with an optional reason."""
-    afk_users[ctx.author.id] = reason
+    await set_afk(ctx.guild.id, ctx.author.id, reason)
     await ctx.send(f"{ctx.author.mention} is now AFK: {reason}")
 
-@bot.event
-async def on_message(message):
-    if message.author.bot:
-        return
+async def afk_stage(view):
+    if view.guild is None or not afk_users:
+        return False
+    lines = []
 
     # Agar AFK user wapas message bhejta hai toh unka AFK hata do
-    if message.author.id in afk_users:
-        del afk_users[message.author.id]
-        await message.channel.send(f"Welcome back {message.author.mention}, I removed your AFK.")
+    if (view.guild.id, view.author.id) in afk_users:
+        await clear_afk(view.guild.id, view.author.id)
+        lines.append(f"Welcome back {view.author.mention}, I removed your AFK.")
 
     # Agar koi AFK user ko mention kare toh unka reason dikhado
-    for mention in message.mentions:
-        if mention.id in afk_users:
-            reason = afk_users[mention.id]
-            await message.channel.send(f"{mention.display_name} is AFK: {reason}")
+    # (once per channel per cooldown, all in a single reply)
+    seen = set()
+    for mention in view.mentions:
+        entry = afk_users.get((view.guild.id, mention.id))
+        if entry is None or mention.id in seen:
+            continue
+        seen.add(mention.id)
+        key = (view.channel.id, mention.id)
+        if view.now - afk_notice_times.get(key, 0) < AFK_NOTICE_COOLDOWN:
+            continue
+        afk_notice_times[key] = view.now
+        reason, since = entry
+        lines.append(f"{mention.display_name} is AFK: {reason} (<t:{int(since)}:R>)")
+
+    if len(afk_notice_times) > 10000:
+        cutoff = view.now - AFK_NOTICE_COOLDOWN
+        for key in [k for k, t in afk_notice_times.items() if t < cutoff]:
+            del afk_notice_times[key]
+
+    if lines:
+        try:
+            await view.message.reply("\n".join(lines), mention_author=False,
+                                     allowed_mentions=discord.AllowedMentions.none())
+        except Exception:
+            pass
+    return False
+
 
-    await bot.process_commands(message)
+async def commands_stage(view):
+    await bot.process_commands(view.message)
+    return False
+
+# =========================
+# Message pipeline
+# =========================
+# single on_message: automod -> AFK -> commands, stopping early once
+# automod has removed the message
+message_pipeline = Pipeline([
+    ("store", store_stage),
+    ("anti_spam", automod_spam),
+    ("content_filter", automod_content),
+    ("anti_mass_mention", automod_mass_mentions),
+    ("afk", afk_stage),
+    ("commands", commands_stage),
+])
+
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    await message_pipeline.run(MessageView(message))
+
+
+@bot.command(name="pipeline-stats")
+@commands.has_permissions(manage_guild=True)
+async def pipeline_stats(ctx):
+    """Per-stage cost of on_message since startup."""
+    lines = [f"{'stage':<18}{'calls':>8}{'stops':>7}{'errors':>8}{'avg µs':>10}{'max µs':>10}"]
+    for name, calls, stops, errors, avg_us, max_us in message_pipeline.summary():
+        lines.append(f"{name:<18}{calls:>8}{stops:>7}{errors:>8}{avg_us:>10.1f}{max_us:>10.1f}")
+    await ctx.send(f"📈 {message_pipeline.messages} messages processed\n```\n" + "\n".join(lines) + "\n```")
+
+
+
+@bot.command(name="handler-stats")
+@commands.has_permissions(administrator=True)
+async def handler_stats(ctx, n: int = 10, sort: str = "p99"):
+    """Slowest events/commands since startup. Usage: $handler-stats 10 p99"""
+    sort = sort.lower()
+    if sort not in HandlerProfiler.SORT_KEYS:
+        return await ctx.send(f"❌ Sort by one of: {', '.join(HandlerProfiler.SORT_KEYS)}")
+    n = max(1, min(n, 25))
+    lag, lag_p50, lag_p99, lag_max = loop_watchdog.summary()
+    lines = [f"{'handler':<32}{'calls':>7}{'slow':>5}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+    for kind, name, calls, slow, p50, p99, longest, _ in profiler.top(n, sort):
+        label = f"{'$' if kind == 'command' else ''}{name}"[:31]
+        lines.append(f"{label:<32}{calls:>7}{slow:>5}{p50 * 1000:>9.1f}{p99 * 1000:>9.1f}{longest * 1000:>9.1f}")
+    header = (f"⏱️ Loop lag now {lag * 1000:.1f}ms, p50 {lag_p50 * 1000:.1f}ms, p99 {lag_p99 * 1000:.1f}ms, "
+              f"max {lag_max * 1000:.1f}ms, {loop_watchdog.stalls} stalls")
+    await ctx.send(header + "\n```\n" + "\n".join(lines)[:1900] + "\n```")
 
 # =========================
 # Remind
 # =========================   
+MAX_REMINDER_SECONDS = 365 * 86400
+_reminders_loaded = False
+
+
+async def fire_reminders(batch):
+    now = datetime.now(timezone.utc).timestamp()
+
+    async def deliver(reminder_id, user_id, channel_id, text, due):
+        content = f"⏰ Reminder for <@{user_id}>: {text}"
+        if now - due > 60:
+            content += f"\n*(delayed by {format_duration(now - due)} while I was offline)*"
+        allowed = discord.AllowedMentions(everyone=False, roles=False, users=True)
+        try:
+            channel = bot.get_channel(channel_id)
+            if channel is None:
+                channel = await bot.fetch_user(user_id)
+            await channel.send(content, allowed_mentions=allowed)
+        except Exception as e:
+            print(f"reminder #{reminder_id} delivery failed:", e)
+
+    await asyncio.gather(*(deliver(*r) for r in batch))
+    ids = [r[0] for r in batch]
+    async with db_pool.acquire(BOT_DB) as db:
+        await db.execute(f"DELETE FROM reminders WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        await db.commit()
+
+
+# single task sleeping until the next due reminder, fires them in batches
+reminder_scheduler = Scheduler(fire_reminders)
+
+
+async def load_reminders():
+    global _reminders_loaded
+    if _reminders_loaded:
+        return
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute("SELECT id, user_id, channel_id, message, due_at FROM reminders") as cur:
+            for rid, user_id, channel_id, text, due in await cur.fetchall():
+                reminder_scheduler.schedule(due, (rid, user_id, channel_id, text, due))
+    _reminders_loaded = True
+
+
 @bot.command()
-async def remindme(ctx, time: str, *, reminder: str):
-    """Set a reminder. Usage: $remindme 10m Take a break!"""
-    unit = time[-1]
-    if not time[:-1].isdigit():
-        return await ctx.send("Invalid time format! Example: 10s, 5m, 2h")
-
-    duration = int(time[:-1])
-    if unit == "s":
-        delay = duration
-    elif unit == "m":
-        delay = duration * 60
-    elif unit == "h":
-        delay = duration * 3600
-    else:
-        return await ctx.send("Invalid unit! Use s, m, or h (e.g., 10s, 5m, 1h)")
+async def remindme(ctx, when: str, *, reminder: str):
+    """Set a reminder. Usage: $remindme 10m Take a break! / $remindme 1h30m ... / $remindme 2d ..."""
+    delay = parse_duration(when)
+    if not delay:
+        return await ctx.send("Invalid time format! Examples: 45s, 10m, 1h30m, 2d, 1w")
+    if delay > MAX_REMINDER_SECONDS:
+        return await ctx.send("❌ Reminders can be at most 365 days away.")
 
-    await ctx.send(f"Okay {ctx.author.mention}, I’ll remind you in {time}.")
+    now = datetime.now(timezone.utc).timestamp()
+    due = now + delay
+    async with db_pool.acquire(BOT_DB) as db:
+        cursor = await db.execute(
+            "INSERT INTO reminders (user_id, guild_id, channel_id, message, due_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (ctx.author.id, ctx.guild.id if ctx.guild else None, ctx.channel.id, reminder, due, now)
+        )
+        await db.commit()
+        reminder_id = cursor.lastrowid
+    reminder_scheduler.schedule(due, (reminder_id, ctx.author.id, ctx.channel.id, reminder, due))
 
-    await asyncio.sleep(delay)
-    await ctx.send(f"⏰ Reminder for {ctx.author.mention}: {reminder}")
+    await ctx.send(f"Okay {ctx.author.mention}, I’ll remind you in {format_duration(delay)} (<t:{int(due)}:R>).")
 
 # =========================
 # 💡 Suggestion System (Auto v7.0)
@@ -1210,12 +2329,42 @@ async def remindme(ctx, time: str, *, reminder: str):
 
 SUGGESTION_CHANNEL_ID = 1418641633750159491   # Your suggestion channel
 CO_OWNER_ROLE_ID = 1418641632236011664        # Co-Owner role
+role_index.define("co_owner", CO_OWNER_ROLE_ID)
+
+SUGGESTION_STATUSES = {
+    "✅": ("Approved", discord.Color.green()),
+    "❌": ("Denied", discord.Color.red()),
+    "🤔": ("Under Review", discord.Color.gold()),
+}
+
+# message_id -> suggestion id, so the raw reaction handler can drop every
+# unrelated reaction with one dict lookup (backed by idx_suggestions_message)
+suggestion_index = {}
+
+
+async def load_suggestions():
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute("SELECT message_id, id FROM suggestions WHERE message_id IS NOT NULL") as cur:
+            suggestion_index.update(await cur.fetchall())
+
+
+def suggestion_embed(suggestion_id, idea, user_id, status, color, created_at):
+    embed = discord.Embed(
+        title=f"💡 Suggestion #{suggestion_id}",
+        description=f"```{idea}```",
+        color=color,
+        timestamp=created_at
+    )
+    embed.add_field(name="👤 Suggested by", value=f"<@{user_id}>", inline=True)
+    embed.add_field(name="📌 Status", value=status, inline=True)
+    embed.set_footer(text="Suggestion System • Auto v7.0")
+    return embed
 
 
 # =========================
 # 📌 Suggest Command
 # =========================
-@bot.command(name="suggest")
+@bot.command(name="suggest", help="Submit a suggestion")
 async def suggest(ctx, *, idea: str = None):
     if not idea:
         error_embed = discord.Embed(
@@ -1229,41 +2378,20 @@ async def suggest(ctx, *, idea: str = None):
     if not channel:
         return await ctx.send("❌ Suggestion channel not found! Please contact an admin.")
 
-    async with aiosqlite.connect("bot.db") as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS suggestions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                message_id INTEGER,
-                channel_id INTEGER,
-                suggestion TEXT,
-                status TEXT DEFAULT 'Pending',
-                created_at TIMESTAMP
-            )
-        """)
-        await db.commit()
-
+    created_at = datetime.now(timezone.utc)
+    async with db_pool.acquire(BOT_DB) as db:
         cursor = await db.execute("INSERT INTO suggestions (user_id, channel_id, suggestion, created_at) VALUES (?, ?, ?, ?)",
-                                  (ctx.author.id, channel.id, idea, datetime.utcnow()))
+                                  (ctx.author.id, channel.id, idea, created_at.isoformat()))
         await db.commit()
         suggestion_id = cursor.lastrowid
 
-    embed = discord.Embed(
-        title=f"💡 Suggestion #{suggestion_id}",
-        description=f"```{idea}```",
-        color=discord.Color.blurple(),
-        timestamp=datetime.utcnow()
-    )
-    embed.add_field(name="👤 Suggested by", value=ctx.author.mention, inline=True)
-    embed.add_field(name="📌 Status", value="⏳ Pending Approval", inline=True)
-    embed.set_footer(text="Suggestion System • Auto v7.0")
-
+    embed = suggestion_embed(suggestion_id, idea, ctx.author.id, "⏳ Pending Approval", discord.Color.blurple(), created_at)
     msg = await channel.send(embed=embed)
-    await msg.add_reaction("✅")  # Approve
-    await msg.add_reaction("❌")  # Deny
-    await msg.add_reaction("🤔")  # Maybe
+    suggestion_index[msg.id] = suggestion_id
+    for emoji in SUGGESTION_STATUSES:
+        await msg.add_reaction(emoji)
 
-    async with aiosqlite.connect("bot.db") as db:
+    async with db_pool.acquire(BOT_DB) as db:
         await db.execute("UPDATE suggestions SET message_id = ? WHERE id = ?", (msg.id, suggestion_id))
         await db.commit()
 
@@ -1279,67 +2407,53 @@ async def suggest(ctx, *, idea: str = None):
 # =========================
 # ⚙️ Reaction Handler (Approve / Deny / Maybe)
 # =========================
+# raw event: works for suggestions that fell out of the message cache too
 @bot.event
-async def on_reaction_add(reaction, user):
-    if user.bot:
-        return
-
-    message = reaction.message
-    guild = message.guild
-
-    # Only trigger inside suggestion channel
-    if not guild or message.channel.id != SUGGESTION_CHANNEL_ID:
-        return
-
-    # Check if message is a suggestion embed
-    if not message.embeds:
+async def on_raw_reaction_add(payload):
+    suggestion_id = suggestion_index.get(payload.message_id)
+    if suggestion_id is None or payload.user_id == bot.user.id:
         return
-
-    embed = message.embeds[0]
-    if not embed.title or not embed.title.startswith("💡 Suggestion #"):
+    emoji = str(payload.emoji)
+    if emoji not in SUGGESTION_STATUSES:
         return
 
     # Check if user is co-owner
-    member = guild.get_member(user.id)
-    if CO_OWNER_ROLE_ID not in [r.id for r in member.roles]:
+    member = payload.member
+    if member is None or member.bot or not role_index.has(member, "co_owner"):
         return
 
-    emoji = str(reaction.emoji)
-    status_map = {
-        "✅": ("Approved", discord.Color.green(), "✅"),
-        "❌": ("Denied", discord.Color.red(), "❌"),
-        "🤔": ("Under Review", discord.Color.gold(), "🤔")
-    }
+    status_text, color = SUGGESTION_STATUSES[emoji]
 
-    if emoji not in status_map:
+    # status update + suggester lookup in one statement
+    async with db_pool.acquire(BOT_DB) as db:
+        async with db.execute(
+            "UPDATE suggestions SET status = ? WHERE id = ? RETURNING user_id, suggestion, created_at",
+            (status_text, suggestion_id)
+        ) as cur:
+            row = await cur.fetchone()
+        await db.commit()
+    if row is None:
         return
+    user_id, idea, created_at = row
 
-    status_text, color, emoji_symbol = status_map[emoji]
-
-    # Find suggestion ID
-    suggestion_id = int(embed.title.split("#")[1])
-
-    # Update embed + DB
-    embed.set_field_at(1, name="📌 Status", value=f"{emoji_symbol} {status_text} by {user.mention}", inline=True)
-    embed.color = color
+    created = datetime.fromisoformat(str(created_at))
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)   # older rows were stored as naive utcnow()
+    channel = bot.get_channel(payload.channel_id)
+    if channel is None:
+        return
+    message = channel.get_partial_message(payload.message_id)
+    embed = suggestion_embed(suggestion_id, idea, user_id, f"{emoji} {status_text} by {member.mention}", color, created)
     await message.edit(embed=embed)
 
-    # Update DB
-    async with aiosqlite.connect("bot.db") as db:
-        await db.execute("UPDATE suggestions SET status = ? WHERE id = ?", (status_text, suggestion_id))
-        await db.commit()
-        cursor = await db.execute("SELECT user_id FROM suggestions WHERE id = ?", (suggestion_id,))
-        row = await cursor.fetchone()
-
-    if row:
-        suggester = guild.get_member(row[0])
-        if suggester:
-            try:
-                await suggester.send(
-                    f"📢 Your suggestion (ID #{suggestion_id}) has been **{status_text}** by {user.mention}."
-                )
-            except:
-                pass
+    suggester = member.guild.get_member(user_id)
+    if suggester:
+        try:
+            await suggester.send(
+                f"📢 Your suggestion (ID #{suggestion_id}) has been **{status_text}** by {member.mention}."
+            )
+        except:
+            pass
 
     # Remove other reactions to prevent spam
     try:
@@ -1378,109 +2492,128 @@ ROLES = {
     "trial": 1418641632236011665,
     "antinuke": 1418641632236011669
 }
+for _key, _ref in ROLES.items():
+    role_index.define(_key, _ref)
+
+# Menus are generated from bot.commands, once per tier (the set of role keys
+# a member holds), and cached until the role configuration changes.
+HELP_DEFAULT_CATEGORY = "⚙️ Utility"
+HELP_CATEGORIES = {
+    "🛡️ Moderation (Staff Only)": ("ban", "kick", "mute", "warn", "unwarn", "warnings", "cmd_permdemote",
+                                  "rape", "recover", "snapshots", "snapshot-bulk", "restore-bulk", "trial",
+                                  "snipe", "snipe-user"),
+    "🛡️ Security (Staff Only)": ("antinuke-enable", "antinuke-disable", "antinuke-status", "antinuke-punish",
+                                "antinuke-log", "antinuke-whitelist-add", "antinuke-whitelist-remove", "antinuke-whitelist-list",
+                                "guild-snapshot", "guild-snapshots", "guild-restore"),
+    "🤖 AutoMod": ("antispam", "filter-add", "filter-remove", "filter-list", "pipeline-stats",
+                   "handler-stats"),
+    "🎉 Fun": ("massping", "ghostping", "suggest", "afk", "remindme"),
+}
+# role-gated commands whose check is a discord permission, as the old menu tiered them;
+# commands using @role_index.require are picked up from their check
+HELP_TIERS = {
+    "ban": ("full_staff", "kick_mute"),
+    "kick": ("full_staff", "kick_mute"),
+    "mute": ("full_staff", "mute_only", "kick_mute"),
+    "warn": ("full_staff",),
+    "unwarn": ("full_staff",),
+    "warnings": ("full_staff", "mute_only", "kick_mute"),
+    "snipe": ("full_staff", "mute_only", "kick_mute"),
+    "snipe-user": ("full_staff", "mute_only", "kick_mute"),
+    "cmd_permdemote": ("full_staff",),
+    "rape": ("rape_recover",),
+    "recover": ("rape_recover",),
+    "snapshots": ("rape_recover",),
+    "snapshot-bulk": ("rape_recover",),
+    "restore-bulk": ("rape_recover",),
+    "antinuke-status": ("antinuke",),
+    "antinuke-whitelist-list": ("antinuke",),
+    "trial": ("trial",),
+}
+
+help_cache = {}             # tier -> (embeds by category, HelpView)
+help_cache_version = None   # role_index.version the cache was built for
+help_tier_keys = ()         # every role key some command is gated on
 
-@bot.command()
-async def help(ctx):
-    user_roles = [r.id for r in ctx.author.roles]
-
-    categories = {}
-
-    # Staff-only: Moderation
-    moderation_cmds = []
-    if ROLES["full_staff"] in user_roles or ROLES["kick_mute"] in user_roles:
-        moderation_cmds.extend([
-            "`$ban @user [reason]` - Ban a user",
-            "`$kick @user [reason]` - Kick a user"
-        ])
-    if ROLES["full_staff"] in user_roles or ROLES["mute_only"] in user_roles or ROLES["kick_mute"] in user_roles:
-        moderation_cmds.append("`$mute @user [time]` - Mute a user")
-    if ROLES["full_staff"] in user_roles:
-        moderation_cmds.extend([
-            "`$unmute @user` - Unmute a user",
-            "`$warn @user [reason]` - Warn a user",
-            "`$unwarn <case_id>` - Remove a warning",
-            "`$permdemote @user` - Permanent demotion"
-        ])
-    if any(role in user_roles for role in ROLES["rape_recover"]):
-        moderation_cmds.extend([
-            "`$rape @user` - Remove all roles",
-            "`$recover @user` - Restore removed roles"
-        ])
-    if ROLES["trial"] in user_roles:
-        moderation_cmds.append("`$trial @user` - Add trial staff roles")
-
-    if moderation_cmds:
-        categories["🛡️ Moderation (Staff Only)"] = moderation_cmds
-
-    # Utility
-    categories["⚙️ Utility"] = [
-        "`$userinfo @user` - View info about a user",
-        "`$serverinfo` - View server info",
-        "`$addrole @user @role` - Add role",
-        "`$removerole @user @role` - Remove role",
-        "`$purge [amount]` - Delete messages",
-        "`$lock` / `$unlock` - Lock or unlock a channel"
-    ]
 
-    # Security
-    security_cmds = []
-    if ROLES["antinuke"] in user_roles:
-        security_cmds.extend([
-            "`$antinuke` - Enable anti-nuke protection",
-            "`$disableantinuke` - Disable anti-nuke protection"
-        ])
-    if security_cmds:
-        categories["🛡️ Security (Staff Only)"] = security_cmds
-
-    # Management
-    management_cmds = []
-    if ROLES["full_staff"] in user_roles:
-        management_cmds.extend([
-            "`$setprefix <prefix>` - Change bot prefix",
-            "`$settings` - View server settings"
-        ])
-    if management_cmds:
-        categories["📊 Management (Staff Only)"] = management_cmds
-
-    # -----------------
-    # Create embeds per category
-    # -----------------
+def command_role_keys(command):
+    for check in command.checks:
+        keys = getattr(check, "role_keys", None)
+        if keys:
+            return keys
+    return HELP_TIERS.get(command.name)
+
+
+def help_tier(member):
+    return frozenset(k for k in help_tier_keys if role_index.has(member, k))
+
+
+def build_help(tier):
+    category_of = {name: cat for cat, names in HELP_CATEGORIES.items() for name in names}
+    categories = {cat: [] for cat in HELP_CATEGORIES}
+    categories[HELP_DEFAULT_CATEGORY] = []
+    for command in sorted(bot.commands, key=lambda c: c.name):
+        keys = command_role_keys(command)
+        if command.hidden or command.name == "help" or (keys and tier.isdisjoint(keys)):
+            continue
+        usage = f"${command.name} {command.signature}".strip()
+        description = command.short_doc
+        categories[category_of.get(command.name, HELP_DEFAULT_CATEGORY)].append(
+            f"`{usage}` - {description}" if description else f"`{usage}`"
+        )
+
     embeds = {}
-    for cat, cmds in categories.items():
-        embed = discord.Embed(
-            title=f"Help — {cat}",
-            description="\n".join(cmds),
-            color=discord.Color.blurple()
+    for cat, lines in categories.items():
+        if lines:
+            embeds[cat] = discord.Embed(title=f"Help — {cat}", description="\n".join(lines),
+                                        color=discord.Color.blurple())
+    return embeds, HelpView(list(embeds))
+
+
+def help_menu(member):
+    global help_cache_version, help_tier_keys
+    if help_cache_version != role_index.version:
+        help_cache.clear()
+        help_cache_version = role_index.version
+        help_tier_keys = tuple({k for command in bot.commands if (ks := command_role_keys(command)) for k in ks})
+    tier = help_tier(member)
+    menu = help_cache.get(tier)
+    if menu is None:
+        menu = help_cache[tier] = build_help(tier)
+    return menu
+
+
+class HelpView(View):
+    """One instance per tier, reused for every message. Persistent (no timeout,
+    fixed custom_id), so menus keep working after a restart."""
+
+    def __init__(self, categories):
+        super().__init__(timeout=None)
+        self.select = Select(
+            custom_id="help:category",
+            placeholder="Select a category...",
+            options=[discord.SelectOption(label=cat, description=f"View {cat} commands", emoji=cat.split(" ")[0])
+                     for cat in categories]
         )
-        embed.set_footer(text=f"Requested by {ctx.author}", icon_url=ctx.author.display_avatar.url)
-        embeds[cat] = embed
-
-    # -----------------
-    # Dropdown menu view with emojis
-    # -----------------
-    class HelpDropdown(View):
-        def __init__(self):
-            super().__init__(timeout=120)
-            options = [
-                discord.SelectOption(label=cat, description=f"View {cat} commands", emoji=cat.split(" ")[0])
-                for cat in categories.keys()
-            ]
-            self.select = Select(placeholder="Select a category...", options=options)
-            self.select.callback = self.callback
-            self.add_item(self.select)
-
-        async def callback(self, interaction: discord.Interaction):
-            selected = self.select.values[0]
-            await interaction.response.edit_message(embed=embeds[selected], view=self)
-
-    view = HelpDropdown()
-    first_category = list(categories.keys())[0]
-    await ctx.send(embed=embeds[first_category], view=view)
+        self.select.callback = self.on_select
+        self.add_item(self.select)
+
+    async def on_select(self, interaction: discord.Interaction):
+        embeds, _ = help_menu(interaction.user)
+        embed = embeds.get(self.select.values[0])
+        if embed is None:
+            return await interaction.response.send_message("❌ That category isn't available to you.", ephemeral=True)
+        await interaction.response.edit_message(embed=embed)
+
+
+@bot.command()
+async def help(ctx):
+    embeds, view = help_menu(ctx.author)
+    await ctx.send(embed=next(iter(embeds.values())), view=view)
 
 # =========================
 # Run
 # =========================
-keep_alive()
 bot.run(os.getenv('DISCORD_TOKEN'))
 
 
@@ -0,0 +1,104 @@
+import sys
+from collections import OrderedDict
+
+# =========================
+# Recent message store
+# =========================
+# Compact copies of recent guild messages (ids, content, attachment URLs)
+# so raw delete/edit events can still say what the message was. Each guild
+# has its own LRU, capped in bytes; the whole store has a byte cap too, and
+# when it's hit the biggest guild gives up its oldest entries first. Evicted
+# entries are handed to `on_evict` (e.g. to spill them to SQLite).
+
+RECORD_OVERHEAD = 200   # slots object + OrderedDict entry + ints, roughly
+
+
+class StoredMessage:
+    __slots__ = ("id", "guild_id", "channel_id", "author_id", "content", "attachments", "created_at", "size")
+
+    def __init__(self, id, guild_id, channel_id, author_id, content, attachments, created_at):
+        self.id = id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.content = content or ""
+        self.attachments = attachments      # newline-joined URLs, same as the archive column
+        self.created_at = created_at        # unix seconds
+        self.size = RECORD_OVERHEAD + sys.getsizeof(self.content) + sys.getsizeof(attachments)
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message.id, message.guild.id, message.channel.id, message.author.id, message.content,
+                   "\n".join(a.url for a in message.attachments), message.created_at.timestamp())
+
+
+class MessageStore:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, guild_max_bytes: int = 4 * 1024 * 1024, on_evict=None):
+        self.max_bytes = max_bytes
+        self.guild_max_bytes = guild_max_bytes
+        self.on_evict = on_evict            # fn(list of StoredMessage)
+        self.bytes = 0
+        self.evictions = 0
+        self._guilds = {}                   # guild_id -> OrderedDict(message_id -> StoredMessage)
+        self._guild_bytes = {}              # guild_id -> bytes
+
+    def __len__(self):
+        return sum(len(g) for g in self._guilds.values())
+
+    def add(self, record: StoredMessage):
+        guild = self._guilds.get(record.guild_id)
+        if guild is None:
+            guild = self._guilds[record.guild_id] = OrderedDict()
+            self._guild_bytes[record.guild_id] = 0
+        old = guild.pop(record.id, None)
+        if old is not None:
+            self._account(record.guild_id, -old.size)
+        guild[record.id] = record
+        self._account(record.guild_id, record.size)
+
+        evicted = []
+        while self._guild_bytes[record.guild_id] > self.guild_max_bytes and len(guild) > 1:
+            evicted.append(self._evict_oldest(record.guild_id))
+        if self.bytes > self.max_bytes:
+            while self.bytes > self.max_bytes:
+                biggest = max(self._guild_bytes, key=self._guild_bytes.get)
+                evicted.append(self._evict_oldest(biggest))
+        if evicted:
+            self.evictions += len(evicted)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def get(self, guild_id, message_id):
+        guild = self._guilds.get(guild_id)
+        return guild.get(message_id) if guild else None
+
+    def pop(self, guild_id, message_id):
+        guild = self._guilds.get(guild_id)
+        record = guild.pop(message_id, None) if guild else None
+        if record is not None:
+            self._account(guild_id, -record.size)
+        return record
+
+    def edit(self, record: StoredMessage, content: str):
+        """Store the new content of a message, keeping its LRU position fresh."""
+        self.pop(record.guild_id, record.id)
+        record.content = content or ""
+        record.size = RECORD_OVERHEAD + sys.getsizeof(record.content) + sys.getsizeof(record.attachments)
+        self.add(record)
+
+    def forget_guild(self, guild_id):
+        self.bytes -= self._guild_bytes.pop(guild_id, 0)
+        self._guilds.pop(guild_id, None)
+
+    def _account(self, guild_id, delta):
+        self._guild_bytes[guild_id] += delta
+        self.bytes += delta
+
+    def _evict_oldest(self, guild_id):
+        guild = self._guilds[guild_id]
+        _, record = guild.popitem(last=False)
+        self._account(guild_id, -record.size)
+        if not guild:
+            del self._guilds[guild_id]
+            self.bytes -= self._guild_bytes.pop(guild_id)
+        return record
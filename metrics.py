@@ -0,0 +1,134 @@
+import bisect
+import math
+
+# =========================
+# Prometheus metrics
+# =========================
+# A tiny in-process registry that renders the Prometheus text format
+# (https://prometheus.io/docs/instrumenting/exposition_formats/). Counters
+# and histograms are bumped by the handlers themselves; gauges (and counters
+# that already live on some other object) are read through a callback at
+# scrape time, so nothing is polled in the background. Everything is touched
+# from the bot loop only, the HTTP side asks the loop to render.
+
+# seconds; handler and query latencies mostly sit between 1ms and 1s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _value(v) -> str:
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        # fn() -> number, or {label values tuple: number} when labelled
+        self.fn = fn
+        self.values = {}    # label values tuple -> number
+
+    def samples(self):
+        if self.fn is None:
+            return self.values.items()
+        value = self.fn()
+        return value.items() if isinstance(value, dict) else [((), value)]
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for key, value in self.samples():
+            if value is None:
+                continue
+            out.append(f"{self.name}{_labels(self.label_names, key)} {_value(value)}")
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            # per-bucket (not cumulative) counts, then sum, then count
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, out):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+        for key, (counts, total, count) in self.values.items():
+            running = 0
+            # counts[-1] is the overflow bucket, only reported as +Inf
+            for bound, n in zip(self.buckets, counts[:-1], strict=True):
+                running += n
+                le = _labels(self.label_names, key, 'le="%s"' % _value(bound))
+                out.append(f"{self.name}_bucket{le} {running}")
+            le = _labels(self.label_names, key, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {count}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_value(total)}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), fn=None) -> Counter:
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name, help, labels=(), fn=None) -> Gauge:
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        out = []
+        for metric in self.metrics:
+            try:
+                metric.render(out)
+            except Exception as e:
+                # one broken callback shouldn't take the whole scrape down
+                out.append(f"# {metric.name} failed: {_escape(e)}")
+        return "\n".join(out) + "\n"
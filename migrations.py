@@ -0,0 +1,283 @@
+import sqlite3
+import sys
+
+# =========================
+# Schema migrations
+# =========================
+# Each list entry is one schema version; PRAGMA user_version records how many
+# have been applied to a file. Never edit a shipped entry, append a new one.
+# Version 1 uses IF NOT EXISTS everywhere so databases created by the old
+# ad-hoc setup functions are adopted as-is.
+
+CASES_MIGRATIONS = [
+    # 1: cases + trigger-maintained per-user counters
+    """
+    CREATE TABLE IF NOT EXISTS cases (
+        case_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        moderator_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        reason TEXT,
+        timestamp TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_cases_guild_user ON cases (guild_id, user_id, case_id);
+
+    CREATE TABLE IF NOT EXISTS case_counts (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, user_id, action)
+    ) WITHOUT ROWID;
+    CREATE TRIGGER IF NOT EXISTS cases_count_insert AFTER INSERT ON cases BEGIN
+        INSERT INTO case_counts (guild_id, user_id, action, count)
+        VALUES (NEW.guild_id, NEW.user_id, NEW.action, 1)
+        ON CONFLICT (guild_id, user_id, action) DO UPDATE SET count = count + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS cases_count_delete AFTER DELETE ON cases BEGIN
+        UPDATE case_counts SET count = count - 1
+        WHERE guild_id = OLD.guild_id AND user_id = OLD.user_id AND action = OLD.action;
+    END;
+    INSERT OR REPLACE INTO case_counts (guild_id, user_id, action, count)
+    SELECT guild_id, user_id, action, COUNT(*) FROM cases GROUP BY guild_id, user_id, action;
+    """,
+    # 2: $warnings filtered by action, paginated on case_id
+    """
+    CREATE INDEX IF NOT EXISTS idx_cases_guild_user_action ON cases (guild_id, user_id, action, case_id);
+    """,
+]
+
+BOT_MIGRATIONS = [
+    # 1: anti-nuke config, deleted message archive, suggestions
+    """
+    CREATE TABLE IF NOT EXISTS antinuke (
+        guild_id INTEGER PRIMARY KEY,
+        enabled INTEGER DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS antinuke_whitelist (
+        guild_id INTEGER,
+        user_id INTEGER,
+        PRIMARY KEY (guild_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS antinuke_logs (
+        guild_id INTEGER PRIMARY KEY,
+        channel_id INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS deleted_messages (
+        guild_id INTEGER,
+        channel_id INTEGER,
+        message_id INTEGER PRIMARY KEY,
+        author_id INTEGER,
+        content TEXT,
+        attachments TEXT,
+        timestamp TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_deleted_messages_channel ON deleted_messages (guild_id, channel_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_deleted_messages_author ON deleted_messages (guild_id, author_id, timestamp);
+
+    CREATE TABLE IF NOT EXISTS suggestions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        message_id INTEGER,
+        channel_id INTEGER,
+        suggestion TEXT,
+        status TEXT DEFAULT 'Pending',
+        created_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_suggestions_message ON suggestions (message_id);
+    """,
+    # 2: per-guild automod thresholds
+    """
+    CREATE TABLE IF NOT EXISTS automod_config (
+        guild_id INTEGER PRIMARY KEY,
+        spam_messages INTEGER NOT NULL DEFAULT 5,
+        spam_seconds REAL NOT NULL DEFAULT 5
+    );
+    """,
+    # 3: per-guild content filter rules (kind = 'word' | 'regex')
+    """
+    CREATE TABLE IF NOT EXISTS automod_filters (
+        guild_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        pattern TEXT NOT NULL,
+        PRIMARY KEY (guild_id, kind, pattern)
+    ) WITHOUT ROWID;
+    """,
+    # 4: persistent reminders ($remindme)
+    """
+    CREATE TABLE IF NOT EXISTS reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        guild_id INTEGER,
+        channel_id INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        due_at REAL NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (due_at);
+    """,
+    # 5: AFK status per guild
+    """
+    CREATE TABLE IF NOT EXISTS afk (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        reason TEXT,
+        since REAL NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    ) WITHOUT ROWID;
+    """,
+    # 6: role snapshot history for rape/recover and bulk restores
+    """
+    CREATE TABLE IF NOT EXISTS role_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        role_ids TEXT NOT NULL,
+        label TEXT NOT NULL,
+        taken_by INTEGER,
+        taken_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_role_snapshots_user ON role_snapshots (guild_id, user_id, id);
+    CREATE INDEX IF NOT EXISTS idx_role_snapshots_label ON role_snapshots (guild_id, label);
+    """,
+    # 7: anti-nuke punishment per guild (punishment = 'strip' | 'ban')
+    """
+    ALTER TABLE antinuke ADD COLUMN punishment TEXT NOT NULL DEFAULT 'strip';
+    ALTER TABLE antinuke ADD COLUMN max_actions INTEGER NOT NULL DEFAULT 3;
+    ALTER TABLE antinuke ADD COLUMN window_seconds REAL NOT NULL DEFAULT 10;
+    """,
+    # 8: guild structure snapshots. guild_objects is versioned: a row is valid
+    # for snapshots valid_from <= id < valid_to, so unchanged objects cost nothing
+    """
+    CREATE TABLE IF NOT EXISTS guild_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        taken_at TEXT NOT NULL,
+        changed INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_guild_snapshots_guild ON guild_snapshots (guild_id, id);
+    CREATE TABLE IF NOT EXISTS guild_objects (
+        id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        object_id INTEGER NOT NULL,
+        valid_from INTEGER NOT NULL,
+        valid_to INTEGER,
+        digest BLOB NOT NULL,
+        data BLOB NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_guild_objects_open ON guild_objects (guild_id, valid_to);
+    CREATE INDEX IF NOT EXISTS idx_guild_objects_from ON guild_objects (guild_id, valid_from);
+    """,
+    # 9: deleted message archive retention (per-guild age/size caps)
+    """
+    CREATE INDEX IF NOT EXISTS idx_deleted_messages_guild_time ON deleted_messages (guild_id, timestamp);
+    """,
+    # 10: overflow for the in-memory recent message store (raw delete/edit logging)
+    """
+    CREATE TABLE IF NOT EXISTS message_spill (
+        message_id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        content TEXT,
+        attachments TEXT,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_message_spill_created ON message_spill (created_at);
+    """,
+]
+
+
+def _script(version: int, sql: str) -> str:
+    return f"BEGIN;\n{sql}\nPRAGMA user_version = {version};\nCOMMIT;"
+
+
+async def migrate(db, migrations) -> int:
+    """Apply pending migrations on an aiosqlite connection, return the new version."""
+    async with db.execute("PRAGMA user_version") as cur:
+        version = (await cur.fetchone())[0]
+    for target, sql in enumerate(migrations, start=1):
+        if target <= version:
+            continue
+        try:
+            await db.executescript(_script(target, sql))
+        except Exception:
+            await db.rollback()
+            raise
+        version = target
+    return version
+
+
+def migrate_sync(conn: sqlite3.Connection, migrations) -> int:
+    """Same as migrate() for a plain sqlite3 connection (scripts/checks)."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, sql in enumerate(migrations, start=1):
+        if target <= version:
+            continue
+        try:
+            conn.executescript(_script(target, sql))
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+
+# =========================
+# Query plan check
+# =========================
+# Queries on event/command hot paths. Each must be answered by an index
+# search, never a full scan or a temp sort. Keep in sync with main.py.
+HOT_QUERIES = {
+    "cases": [
+        ("SELECT case_id, moderator_id, action, reason, timestamp FROM cases WHERE guild_id = ? AND user_id = ? AND case_id > ? ORDER BY case_id ASC LIMIT ?", (1, 1, 0, 11)),
+        ("SELECT case_id, moderator_id, action, reason, timestamp FROM cases WHERE guild_id = ? AND user_id = ? AND case_id < ? ORDER BY case_id DESC LIMIT ?", (1, 1, 99, 11)),
+        ("SELECT case_id, moderator_id, action, reason, timestamp FROM cases WHERE guild_id = ? AND user_id = ? AND action = ? AND case_id > ? AND timestamp >= ? ORDER BY case_id ASC LIMIT ?", (1, 1, "Warn", 0, "2024", 11)),
+        ("SELECT case_id, guild_id, user_id, moderator_id, action, reason, timestamp FROM cases WHERE case_id = ? AND guild_id = ?", (1, 1)),
+        ("DELETE FROM cases WHERE case_id = ?", (1,)),
+        ("SELECT action, count FROM case_counts WHERE guild_id = ? AND user_id = ?", (1, 1)),
+    ],
+    "bot": [
+        ("UPDATE suggestions SET status = ? WHERE id = ? RETURNING user_id, suggestion, created_at", ("Approved", 1)),
+        ("SELECT id FROM suggestions WHERE message_id = ?", (1,)),
+        ("SELECT id, role_ids, label, taken_at FROM role_snapshots WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT 1", (1, 1)),
+        ("SELECT user_id, role_ids FROM role_snapshots WHERE guild_id = ? AND label = ?", (1, "bulk-1")),
+        ("SELECT message_id, author_id, content, attachments, timestamp FROM deleted_messages WHERE guild_id = ? AND channel_id = ? ORDER BY timestamp DESC LIMIT ?", (1, 1, 10)),
+        ("SELECT message_id, channel_id, content, attachments, timestamp FROM deleted_messages WHERE guild_id = ? AND author_id = ? ORDER BY timestamp DESC LIMIT ?", (1, 1, 10)),
+        ("DELETE FROM deleted_messages WHERE guild_id = ? AND timestamp < ?", (1, "2024")),
+        ("SELECT message_id, guild_id, channel_id, author_id, content, attachments, created_at "
+         "FROM message_spill WHERE message_id IN (?, ?)", (1, 2)),
+        ("DELETE FROM message_spill WHERE created_at < ?", (0,)),
+        ("DELETE FROM deleted_messages WHERE guild_id = ? AND timestamp <= (SELECT timestamp FROM deleted_messages WHERE guild_id = ? ORDER BY timestamp DESC LIMIT 1 OFFSET ?)", (1, 1, 5000)),
+        ("SELECT kind, object_id, digest, id FROM guild_objects WHERE guild_id = ? AND valid_to IS NULL", (1,)),
+        ("SELECT kind, object_id, data FROM guild_objects WHERE guild_id = ? AND valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)", (1, 5, 5)),
+        ("SELECT id, taken_at, changed FROM guild_snapshots WHERE guild_id = ? ORDER BY id DESC LIMIT ?", (1, 10)),
+    ],
+}
+
+
+def check_query_plans(conns) -> list:
+    """Return (query, plan detail) for every hot query that scans or sorts."""
+    problems = []
+    for name, queries in HOT_QUERIES.items():
+        for sql, params in queries:
+            for row in conns[name].execute(f"EXPLAIN QUERY PLAN {sql}", params):
+                detail = row[-1]
+                if detail.startswith("SCAN") or "TEMP B-TREE" in detail:
+                    problems.append((sql, detail))
+    return problems
+
+
+if __name__ == "__main__":
+    conns = {"cases": sqlite3.connect(":memory:"), "bot": sqlite3.connect(":memory:")}
+    migrate_sync(conns["cases"], CASES_MIGRATIONS)
+    migrate_sync(conns["bot"], BOT_MIGRATIONS)
+    problems = check_query_plans(conns)
+    for sql, detail in problems:
+        print(f"FULL SCAN: {detail}\n    {sql}")
+    if problems:
+        sys.exit(1)
+    print(f"query plans ok ({sum(len(q) for q in HOT_QUERIES.values())} hot queries)")
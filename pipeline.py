@@ -0,0 +1,60 @@
+import time
+import traceback
+
+# =========================
+# Message processing pipeline
+# =========================
+# Stages run in order on one shared view of the message. A stage returns
+# True to stop the pipeline (e.g. automod deleted the message, so AFK and
+# command handling are pointless). Every stage is timed. A stage that raises
+# is logged and counted and the next stage runs anyway, so one broken
+# automod rule can't switch off command handling.
+
+
+class StageStats:
+    __slots__ = ("calls", "stops", "errors", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.calls = 0
+        self.stops = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def avg_us(self) -> float:
+        return self.total_ns / self.calls / 1000 if self.calls else 0.0
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)  # [(name, async fn(view) -> bool)]
+        self.stats = {name: StageStats() for name, _ in self.stages}
+        self.messages = 0
+
+    async def run(self, view):
+        self.messages += 1
+        for name, fn in self.stages:
+            stats = self.stats[name]
+            start = time.perf_counter_ns()
+            try:
+                stop = await fn(view)
+            except Exception:
+                stats.errors += 1
+                stop = False
+                print(f"pipeline stage {name!r} failed:")
+                traceback.print_exc()
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                stats.calls += 1
+                stats.total_ns += elapsed
+                if elapsed > stats.max_ns:
+                    stats.max_ns = elapsed
+            if stop:
+                stats.stops += 1
+                return name
+        return None
+
+    def summary(self):
+        """[(name, calls, stops, errors, avg_us, max_us)] in stage order."""
+        return [(name, st.calls, st.stops, st.errors, st.avg_us(), st.max_ns / 1000)
+                for name, st in ((n, self.stats[n]) for n, _ in self.stages)]
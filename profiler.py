@@ -0,0 +1,166 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import asynccontextmanager
+
+# =========================
+# Event loop watchdog + handler profiler
+# =========================
+# LoopWatchdog measures how late the loop wakes up from a short sleep (the
+# lag every other coroutine sees too). A helper thread watches the loop's
+# heartbeat and, when it stops ticking for longer than `threshold`, prints
+# the loop thread's stack, i.e. the code that is blocking it right now.
+#
+# HandlerProfiler times every event/command invocation. An invocation still
+# running after `slow_threshold` gets its await chain printed once (where it
+# is stuck: a DB call, an HTTP request...), and p50/p99 are kept per handler
+# from a window of recent timings.
+
+
+def await_stack(coro):
+    """Frames of a suspended coroutine and everything it is awaiting,
+    outermost first. Task.get_stack() only returns the outermost one."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return traceback.StackSummary.extract(frames)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, keep: int = 600):
+        self.interval = interval
+        self.threshold = threshold      # a loop stuck this long gets its stack printed
+        self.lag = 0.0                  # last measured lag, seconds
+        self.max_lag = 0.0
+        self.stalls = 0                 # times the loop was stuck past threshold
+        self.recent = deque(maxlen=keep)
+        self._beat = time.monotonic()
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop_thread_id = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.recent.append(lag)
+            self._beat = time.monotonic()
+
+    def _watch(self):
+        reported = None     # heartbeat of the stall we already printed
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stuck = time.monotonic() - beat - self.interval
+            if stuck < self.threshold or reported == beat:
+                continue
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "  (no frame)\n"
+            print(f"⚠️ event loop blocked for {stuck * 1000:.0f}ms, loop thread is at:\n{stack}", end="")
+
+    def summary(self):
+        """(last, p50, p99, max) lag in seconds over the recent window."""
+        values = sorted(self.recent)
+        return self.lag, percentile(values, 0.5), percentile(values, 0.99), self.max_lag
+
+
+class HandlerStats:
+    __slots__ = ("calls", "slow", "total", "max", "recent")
+
+    def __init__(self, keep):
+        self.calls = 0
+        self.slow = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=keep)
+
+    def add(self, elapsed, slow):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if slow:
+            self.slow += 1
+        self.recent.append(elapsed)
+
+
+class HandlerProfiler:
+    SORT_KEYS = ("p99", "p50", "max", "total", "calls")
+
+    def __init__(self, slow_threshold: float = 2.0, keep: int = 512):
+        self.slow_threshold = slow_threshold
+        self.keep = keep                # timings per handler used for p50/p99
+        self.stats = {}                 # (kind, name) -> HandlerStats
+
+    @asynccontextmanager
+    async def track(self, kind: str, name: str):
+        task = asyncio.current_task()
+        start = time.perf_counter()
+        timer = asyncio.get_running_loop().call_later(self.slow_threshold, self._report_stuck, kind, name, task, start)
+        try:
+            yield
+        finally:
+            timer.cancel()
+            elapsed = time.perf_counter() - start
+            slow = elapsed >= self.slow_threshold
+            stats = self.stats.get((kind, name))
+            if stats is None:
+                stats = self.stats[(kind, name)] = HandlerStats(self.keep)
+            stats.add(elapsed, slow)
+            if slow:
+                print(f"🐢 slow {kind} {name}: {elapsed * 1000:.0f}ms")
+
+    def _report_stuck(self, kind, name, task, start):
+        if task is None or task.done():
+            return
+        stack = "".join(await_stack(task.get_coro()).format())
+        print(f"🐢 {kind} {name} still running after {(time.perf_counter() - start) * 1000:.0f}ms, waiting at:\n{stack}", end="")
+
+    def top(self, n: int = 10, key: str = "p99"):
+        """[(kind, name, calls, slow, p50, p99, max, total)] slowest first."""
+        rows = []
+        for (kind, name), st in self.stats.items():
+            values = sorted(st.recent)
+            rows.append((kind, name, st.calls, st.slow, percentile(values, 0.5), percentile(values, 0.99), st.max, st.total))
+        index = {"p50": 4, "p99": 5, "max": 6, "total": 7, "calls": 2}[key]
+        rows.sort(key=lambda r: r[index], reverse=True)
+        return rows[:n]
@@ -0,0 +1,96 @@
+from discord.ext import commands
+
+# =========================
+# Role lookup index
+# =========================
+# name -> role per guild, built on first use and kept current from the role
+# create/update/delete events, so "find the Muted role" is a dict hit
+# instead of a scan over guild.roles. Special roles are registered under a
+# key (by ID or by name) and checks test the member's roles against them
+# with member.get_role, which never builds the member.roles list.
+
+
+class MissingRole(commands.CheckFailure):
+    """Raised by RoleIndex.require after the invoker was already told why."""
+
+
+class RoleIndex:
+    def __init__(self):
+        self.special = {}       # key -> role ID, tuple of role IDs, or role name
+        self.version = 0        # bumped whenever the special role config changes
+        self._names = {}        # guild_id -> {name: {role_id: role}}
+
+    def define(self, key, ref):
+        self.special[key] = tuple(ref) if isinstance(ref, (list, tuple, set)) else ref
+        self.version += 1
+
+    def _guild(self, guild):
+        names = self._names.get(guild.id)
+        if names is None:
+            names = self._names[guild.id] = {}
+            for role in guild.roles:
+                names.setdefault(role.name, {})[role.id] = role
+        return names
+
+    # kept current by the role listeners in main.py
+    def add(self, role):
+        if role.guild.id in self._names:
+            self._names[role.guild.id].setdefault(role.name, {})[role.id] = role
+
+    def remove(self, role):
+        names = self._names.get(role.guild.id)
+        if names is None:
+            return
+        bucket = names.get(role.name)
+        if bucket is not None:
+            bucket.pop(role.id, None)
+            if not bucket:
+                del names[role.name]
+
+    def update(self, before, after):
+        self.remove(before)
+        self.add(after)
+
+    def forget(self, guild_id):
+        self._names.pop(guild_id, None)
+
+    def by_name(self, guild, name):
+        """Same pick as discord.utils.get(guild.roles, name=name): the lowest role."""
+        bucket = self._guild(guild).get(name)
+        if not bucket:
+            return None
+        if len(bucket) == 1:
+            return next(iter(bucket.values()))
+        return min(bucket.values(), key=lambda r: r.position)
+
+    def get(self, guild, key):
+        ref = self.special[key]
+        if isinstance(ref, str):
+            return self.by_name(guild, ref)
+        if isinstance(ref, tuple):
+            return next(filter(None, map(guild.get_role, ref)), None)
+        return guild.get_role(ref)
+
+    def _ids(self, guild, key):
+        ref = self.special[key]
+        if isinstance(ref, str):
+            role = self.by_name(guild, ref)
+            return (role.id,) if role else ()
+        return ref if isinstance(ref, tuple) else (ref,)
+
+    def has(self, member, *keys):
+        """True when the member holds any of the roles behind keys."""
+        guild = getattr(member, "guild", None)     # a User in DMs has no roles
+        if guild is None:
+            return False
+        return any(member.get_role(rid) is not None for key in keys for rid in self._ids(guild, key))
+
+    def require(self, *keys, message="❌ You don’t have permission"):
+        """Command check: invoker needs any of the roles behind keys."""
+        async def predicate(ctx):
+            if ctx.guild is not None and self.has(ctx.author, *keys):
+                return True
+            await ctx.send(message)
+            raise MissingRole(message)
+        predicate.role_keys = keys      # lets $help tell who can see the command
+        return commands.check(predicate)
@@ -0,0 +1,104 @@
+import asyncio
+import heapq
+import itertools
+import re
+import time
+
+# =========================
+# Deadline scheduler
+# =========================
+# One task for every pending timer: entries sit in a heap ordered by
+# deadline, the task sleeps until the earliest one and hands everything
+# that is due to `fire` in batches. Deadlines are wall-clock (time.time())
+# so they can be persisted and reloaded after a restart.
+
+MAX_SLEEP = 300     # re-check at least this often in case the clock jumps
+
+
+class Scheduler:
+    def __init__(self, fire, batch_size: int = 50):
+        self.fire = fire            # async fn(list of payloads)
+        self.batch_size = batch_size
+        self._heap = []             # (due, seq, payload)
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, due: float, payload):
+        entry = (due, next(self._seq), payload)
+        heapq.heappush(self._heap, entry)
+        # only an earlier deadline changes how long the runner should sleep
+        if self._heap[0] is entry:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            if not self._heap:
+                await self._wake.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            now = time.time()
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._heap)[2])
+            try:
+                await self.fire(batch)
+            except Exception as e:
+                print("scheduler fire error:", e)
+
+
+# =========================
+# Duration parsing
+# =========================
+_UNITS = {"w": 604800, "d": 86400, "h": 3600, "m": 60, "s": 1}
+_DURATION_RE = re.compile(r"(\d+)\s*([wdhms])")
+
+
+def parse_duration(text: str):
+    """'1h30m' / '2d' / '45s' / '1w 2d' -> seconds, or None if unparseable."""
+    text = text.strip().lower()
+    if not text:
+        return None
+    total, pos = 0, 0
+    for m in _DURATION_RE.finditer(text):
+        if text[pos:m.start()].strip():
+            return None
+        total += int(m.group(1)) * _UNITS[m.group(2)]
+        pos = m.end()
+    if pos == 0 or text[pos:].strip():
+        return None
+    return total
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    parts = []
+    for unit, size in _UNITS.items():
+        if seconds >= size:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return "".join(parts) or "0s"
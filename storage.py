@@ -0,0 +1,222 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+# =========================
+# SQLite connection pool
+# =========================
+# One small pool of long-lived aiosqlite connections per database file.
+# aiosqlite runs every connection on its own worker thread, so opening a
+# fresh connection per query costs a thread spawn + file open each time.
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",      # ~8 MB page cache per connection
+    "PRAGMA mmap_size = 67108864",    # 64 MB
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = 4, observe=None):
+        self.path = path
+        self.size = size
+        self.observe = observe      # fn(path, wait_s, held_s) after every acquire
+        self._idle = asyncio.Queue()
+        self._conns = []
+
+    async def open(self):
+        if self._conns:
+            return
+        for _ in range(self.size):
+            db = await aiosqlite.connect(self.path)
+            for pragma in PRAGMAS:
+                await db.execute(pragma)
+            self._conns.append(db)
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        conns, self._conns = self._conns, []
+        self._idle = asyncio.Queue()
+        for db in conns:
+            try:
+                await db.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        db = await self._idle.get()
+        got = time.perf_counter()
+        try:
+            yield db
+        except BaseException:
+            # don't hand a half-finished transaction to the next caller
+            try:
+                await db.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            if db in self._conns:
+                self._idle.put_nowait(db)
+            if self.observe is not None:
+                self.observe(self.path, got - start, time.perf_counter() - got)
+
+
+class Database:
+    """Registry of pools keyed by database file."""
+
+    def __init__(self, size: int = 4, observe=None):
+        self.size = size
+        self.observe = observe
+        self.pools = {}
+
+    async def open(self, *paths: str):
+        for path in paths:
+            pool = self.pools.get(path)
+            if pool is None:
+                pool = self.pools[path] = ConnectionPool(path, self.size, self.observe)
+            await pool.open()
+
+    async def close(self):
+        for pool in self.pools.values():
+            await pool.close()
+        self.pools.clear()
+
+    def acquire(self, path: str):
+        pool = self.pools.get(path)
+        if pool is None:
+            raise RuntimeError(f"database {path!r} is not open")
+        return pool.acquire()
+
+
+# =========================
+# Write-behind batching
+# =========================
+class FlushStats:
+    """Per-batch flush timings for a BatchWriter."""
+
+    def __init__(self, keep: int = 100):
+        self.batches = 0
+        self.rows = 0
+        self.commit_seconds = 0.0
+        self.fsync_saved_seconds = 0.0
+        self.recent = deque(maxlen=keep)   # (rows, flush_s, commit_s, saved_s)
+
+    def record(self, rows: int, flush_s: float, commit_s: float):
+        # every row beyond the first would have paid its own commit
+        saved = commit_s * (rows - 1)
+        self.batches += 1
+        self.rows += rows
+        self.commit_seconds += commit_s
+        self.fsync_saved_seconds += saved
+        self.recent.append((rows, flush_s, commit_s, saved))
+
+    def summary(self) -> str:
+        avg = self.rows / self.batches if self.batches else 0
+        return (f"{self.rows} rows in {self.batches} batches (avg {avg:.1f}/batch), "
+                f"commit {self.commit_seconds * 1000:.1f}ms, "
+                f"~{self.fsync_saved_seconds * 1000:.1f}ms fsync saved")
+
+
+class BatchWriter:
+    """Groups single-row INSERTs into one transaction every max_delay seconds
+    or max_rows rows. Each submit() resolves to that row's lastrowid."""
+
+    def __init__(self, db: Database, path: str, max_rows: int = 50, max_delay: float = 0.05):
+        self.db = db
+        self.path = path
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.stats = FlushStats()
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, sql: str, params=()):
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sql, params, fut))
+        return await fut
+
+    def enqueue(self, sql: str, params=()):
+        """Write-behind: queue the row and return immediately; errors are only logged."""
+        self._queue.put_nowait((sql, params, None))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # drain whatever was queued behind the stop marker
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        for i in range(0, len(rest), self.max_rows):
+            await self._flush(rest[i:i + self.max_rows])
+
+    async def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            async with self.db.acquire(self.path) as db:
+                ids = []
+                for sql, params, _ in batch:
+                    cur = await db.execute(sql, params)
+                    ids.append(cur.lastrowid)
+                commit_start = time.perf_counter()
+                await db.commit()
+                commit_s = time.perf_counter() - commit_start
+        except Exception as e:
+            # one bad row shouldn't fail everyone else's insert
+            if len(batch) > 1:
+                for item in batch:
+                    await self._flush([item])
+            else:
+                _, _, fut = batch[0]
+                if fut is None:
+                    print(f"batch writer: dropped row for {self.path}: {e}")
+                elif not fut.done():
+                    fut.set_exception(e)
+            return
+        self.stats.record(len(batch), time.perf_counter() - start, commit_s)
+        for (_, _, fut), rowid in zip(batch, ids, strict=True):
+            if fut is not None and not fut.done():
+                fut.set_result(rowid)